@@ -28,7 +28,6 @@ from AlmaGag.config import (
     CANVAS_MARGIN_XLARGE, CANVAS_MARGIN_LARGE, CANVAS_MARGIN_SMALL,
     MOVEMENT_THRESHOLD, MOVEMENT_MAX_DISTANCE, MOVEMENT_DEFAULT_DY
 )
-from AlmaGag.utils import extract_item_id
 
 
 class AutoLayoutOptimizer(LayoutOptimizer):
@@ -179,14 +178,11 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             if 'contains' in elem and elem.get('_resolved'):
                 del elem['_resolved']
                 # También resetear coordenadas locales de elementos contenidos
-                for ref in elem.get('contains', []):
-                    ref_id = extract_item_id(ref)
+                for ref_id in current.container_children.get(elem['id'], []):
                     contained = current.elements_by_id.get(ref_id)
                     if contained:
-                        if '_local_x' in contained:
-                            del contained['_local_x']
-                        if '_local_y' in contained:
-                            del contained['_local_y']
+                        contained.pop('_local_x', None)
+                        contained.pop('_local_y', None)
 
         # Re-resolver contenedores con centrado
         container_hierarchy = self.positioner._analyze_container_hierarchy(current)
@@ -401,10 +397,7 @@ class AutoLayoutOptimizer(LayoutOptimizer):
 
         # Filtrar elementos que ya tienen posiciones calculadas
         # (excluir contenedores sin dimensiones y elementos sin coordenadas)
-        normal_elements = [
-            e for e in layout.elements
-            if 'x' in e and ('contains' not in e or e.get('_is_container_calculated', False))
-        ]
+        normal_elements = [e for e in layout.normal_elements if 'x' in e]
 
         # Ordenar elementos por prioridad (high primero)
         sorted_elements = sorted(
@@ -412,11 +405,15 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             key=lambda e: layout.priorities.get(e['id'], 1)
         )
 
+        # Los elementos no se mueven durante esta fase: íconos, etiquetas de
+        # conexiones y líneas se calculan una sola vez para todas las etiquetas
+        obstacles = self._collect_label_obstacles(layout)
+
         # Calcular posiciones de etiquetas de íconos en orden de prioridad
         for elem in sorted_elements:
             if elem.get('label'):
                 preferred = elem.get('label_position', 'bottom')
-                pos = self._find_best_label_position(layout, elem, preferred)
+                pos = self._find_best_label_position(layout, elem, preferred, obstacles)
                 layout.label_positions[elem['id']] = pos
 
     def _try_relocate_labels(self, layout: Layout) -> bool:
@@ -433,6 +430,10 @@ class AutoLayoutOptimizer(LayoutOptimizer):
         """
         improved = False
 
+        # Aquí solo se mueven etiquetas: la geometría de íconos y líneas
+        # se comparte entre todas las consultas
+        queries = self.collision_detector.prepare_element_queries(layout)
+
         for elem in layout.elements:
             if not elem.get('label'):
                 continue
@@ -440,7 +441,8 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             elem_id = elem['id']
             current_collisions = self.collision_detector.count_element_collisions(
                 layout,
-                elem_id
+                elem_id,
+                queries
             )
 
             if current_collisions == 0:
@@ -466,7 +468,8 @@ class AutoLayoutOptimizer(LayoutOptimizer):
 
                 new_collisions = self.collision_detector.count_element_collisions(
                     layout,
-                    elem_id
+                    elem_id,
+                    queries
                 )
 
                 if new_collisions < best_collisions:
@@ -483,11 +486,42 @@ class AutoLayoutOptimizer(LayoutOptimizer):
 
         return improved
 
+    def _collect_label_obstacles(self, layout: Layout) -> Tuple[List, List, List]:
+        """
+        Recolecta los obstáculos de etiquetas que solo dependen de los elementos.
+
+        Args:
+            layout: Layout con elementos y conexiones
+
+        Returns:
+            Tuple: (icon_bboxes, connection_label_bboxes, connection_lines)
+                icon_bboxes: [(elem_id, bbox)] de elementos normales
+                connection_label_bboxes: [bbox] de etiquetas de conexiones
+                connection_lines: [endpoints] de conexiones
+        """
+        icon_bboxes = [
+            (elem['id'], self.geometry.get_icon_bbox(elem))
+            for elem in layout.normal_elements
+        ]
+
+        connection_label_bboxes = []
+        connection_lines = []
+        for conn in layout.connections:
+            bbox = self.geometry.get_connection_label_bbox(layout, conn)
+            if bbox:
+                connection_label_bboxes.append(bbox)
+            endpoints = self.geometry.get_connection_endpoints(layout, conn)
+            if endpoints:
+                connection_lines.append(endpoints)
+
+        return icon_bboxes, connection_label_bboxes, connection_lines
+
     def _find_best_label_position(
         self,
         layout: Layout,
         element: dict,
-        preferred: str = 'bottom'
+        preferred: str = 'bottom',
+        obstacles: Tuple[List, List, List] = None
     ) -> Tuple[float, float, str, str]:
         """
         Encuentra la mejor posición para una etiqueta.
@@ -502,6 +536,8 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             layout: Layout actual
             element: Elemento del diagrama
             preferred: Posición preferida
+            obstacles: Resultado de _collect_label_obstacles() reutilizable
+                mientras los elementos no se muevan (si es None, se calcula)
 
         Returns:
             Tuple: (x, y, anchor, position)
@@ -518,21 +554,17 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             positions.remove(preferred)
             positions.insert(0, preferred)
 
+        if obstacles is None:
+            obstacles = self._collect_label_obstacles(layout)
+        icon_bboxes, connection_label_bboxes, connection_lines = obstacles
+
         # Recolectar bboxes de otros elementos (íconos y etiquetas existentes)
         # Incluir contenedores con dimensiones calculadas
-        occupied_bboxes = []
-        for elem in layout.elements:
-            if elem['id'] != element['id']:
-                # Incluir contenedores CON dimensiones, excluir sin dimensiones
-                if 'contains' in elem and not elem.get('_is_container_calculated', False):
-                    continue
-                occupied_bboxes.append(self.geometry.get_icon_bbox(elem))
+        element_id = element['id']
+        occupied_bboxes = [bbox for elem_id, bbox in icon_bboxes if elem_id != element_id]
 
         # Añadir etiquetas de conexiones
-        for conn in layout.connections:
-            bbox = self.geometry.get_connection_label_bbox(layout, conn)
-            if bbox:
-                occupied_bboxes.append(bbox)
+        occupied_bboxes.extend(connection_label_bboxes)
 
         # Añadir etiquetas de otros íconos ya calculadas
         for elem_id, pos_info in layout.label_positions.items():
@@ -543,13 +575,6 @@ class AutoLayoutOptimizer(LayoutOptimizer):
                     if bbox:
                         occupied_bboxes.append(bbox)
 
-        # Recolectar líneas de conexión
-        connection_lines = []
-        for conn in layout.connections:
-            endpoints = self.geometry.get_connection_endpoints(layout, conn)
-            if endpoints:
-                connection_lines.append(endpoints)
-
         # Probar cada posición
         for pos in positions:
             text_bbox = self.geometry.get_label_bbox(element, pos)
@@ -767,7 +792,7 @@ class AutoLayoutOptimizer(LayoutOptimizer):
         Recalcula todas las estructuras después de mover elementos.
 
         Actualiza (en orden):
-        1. elements_by_id (mapa de acceso rápido)
+        1. elements_by_id y element_to_container (mapas de acceso rápido)
         2. Rutas de conexiones (routing para nuevas posiciones)
         3. Análisis de grafo (levels, groups, priorities)
         4. Posiciones de etiquetas (recalculadas desde cero)
@@ -777,6 +802,7 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             layout: Layout a recalcular
         """
         layout.elements_by_id = {e['id']: e for e in layout.elements}
+        layout.rebuild_containment_index()
 
         # CRÍTICO: Recalcular routing PRIMERO (antes de contenedores y etiquetas)
         # Las conexiones deben reflejar las nuevas posiciones de elementos
@@ -795,14 +821,11 @@ class AutoLayoutOptimizer(LayoutOptimizer):
             if 'contains' in elem and elem.get('_resolved'):
                 del elem['_resolved']
                 # También resetear coordenadas locales de elementos contenidos
-                for ref in elem.get('contains', []):
-                    ref_id = extract_item_id(ref)
+                for ref_id in layout.container_children.get(elem['id'], []):
                     contained = layout.elements_by_id.get(ref_id)
                     if contained:
-                        if '_local_x' in contained:
-                            del contained['_local_x']
-                        if '_local_y' in contained:
-                            del contained['_local_y']
+                        contained.pop('_local_x', None)
+                        contained.pop('_local_y', None)
 
         # Re-resolver contenedores con centrado
         container_hierarchy = self.positioner._analyze_container_hierarchy(layout)
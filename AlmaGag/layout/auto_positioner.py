@@ -12,10 +12,12 @@ Para diagramas sin conexiones, usa layout híbrido por prioridad:
 
 import math
 import logging
+from collections import defaultdict
 from typing import List, Dict
 from AlmaGag.layout.layout import Layout
 from AlmaGag.layout.sizing import SizingCalculator
 from AlmaGag.layout.graph_analysis import GraphAnalyzer
+from AlmaGag.layout.geometry import SpatialIndex
 from AlmaGag.config import (
     ICON_WIDTH, ICON_HEIGHT,
     SPACING_SMALL, SPACING_XLARGE, SPACING_XXLARGE,
@@ -29,16 +31,33 @@ from AlmaGag.config import (
     TOP_MARGIN_DEBUG, TOP_MARGIN_NORMAL,
     LAF_VERTICAL_SPACING
 )
-from AlmaGag.utils import extract_item_id
+from AlmaGag.utils import label_line_metrics
 
 logger = logging.getLogger('AlmaGag.AutoPositioner')
 
+# Alto de banda para agrupar elementos por Y (consistente con GraphAnalyzer)
+_LEVEL_BAND_HEIGHT = 80
+
+# Número mínimo de contenedores para usar el grid espacial en el ajuste
+# post-expansión (por debajo, el escaneo lineal es más barato)
+_CONTAINER_GRID_MIN = 16
+
+# Columnas del grid interno de un contenedor según número de elementos:
+# 1 → 1 columna, 2-4 → 2 columnas, n > 4 → isqrt(n) + 1 columnas
+_GRID_COLS_TABLE_SIZE = 256
+_GRID_COLS = tuple(
+    1 if n <= 1 else 2 if n <= 4 else math.isqrt(n) + 1
+    for n in range(_GRID_COLS_TABLE_SIZE)
+)
+
 
 class ContainerHierarchy:
     """
     Representa la jerarquía de contenedores y su orden de resolución.
     """
 
+    __slots__ = ('containers', 'hierarchy', 'order', 'containers_by_id')
+
     def __init__(self, containers: List[dict], hierarchy: Dict[str, List[str]], order: List[str]):
         """
         Args:
@@ -108,10 +127,17 @@ class AutoLayoutPositioner:
 
         primary_elements = self._get_primary_elements(layout)
 
-        # Separar primarios con/sin coordenadas
-        missing_both = [e for e in primary_elements if 'x' not in e and 'y' not in e]
-        missing_x = [e for e in primary_elements if 'x' not in e and 'y' in e]
-        missing_y = [e for e in primary_elements if 'x' in e and 'y' not in e]
+        # Separar primarios con/sin coordenadas (una sola pasada)
+        missing_both, missing_x, missing_y = [], [], []
+        for e in primary_elements:
+            has_x = 'x' in e
+            has_y = 'y' in e
+            if not has_x and not has_y:
+                missing_both.append(e)
+            elif not has_x:
+                missing_x.append(e)
+            elif not has_y:
+                missing_y.append(e)
 
         # Resolver conexiones a primarios (contained → container padre)
         primary_ids = {e['id'] for e in primary_elements}
@@ -128,9 +154,10 @@ class AutoLayoutPositioner:
             )
             layout.topological_levels = topological_levels
 
-            logger.debug(f"\n[NIVELES TOPOLOGICOS] ({len(resolved_connections)} edges resueltas)")
-            for elem_id, level in topological_levels.items():
-                logger.debug(f"  {elem_id}: nivel {level}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"\n[NIVELES TOPOLOGICOS] ({len(resolved_connections)} edges resueltas)")
+                for elem_id, level in topological_levels.items():
+                    logger.debug(f"  {elem_id}: nivel {level}")
         else:
             layout.topological_levels = {}
             layout._resolved_primary_connections = []
@@ -175,11 +202,14 @@ class AutoLayoutPositioner:
         Returns:
             Layout: Mismo layout (modificado in-place) con ajustes mínimos
         """
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         logger.debug("\n[AJUSTE POST-EXPANSION DE CONTENEDORES]")
 
         primary_elements = self._get_primary_elements(layout)
-        containers = [e for e in primary_elements if 'contains' in e]
-        free_elements = [e for e in primary_elements if 'contains' not in e]
+        container_ids = layout.container_ids
+        containers, free_elements = [], []
+        for e in primary_elements:
+            (containers if e['id'] in container_ids else free_elements).append(e)
 
         logger.debug(f"  Contenedores: {len(containers)}")
         logger.debug(f"  Elementos libres: {len(free_elements)}")
@@ -203,7 +233,21 @@ class AutoLayoutPositioner:
 
         MARGIN = SPACING_SMALL  # 40px margin around containers
 
-        # For each free element, check overlap with containers and shift if needed
+        # Many containers: only test those sharing grid cells with the element
+        n_containers = len(container_bboxes)
+        grid = None
+        if n_containers >= _CONTAINER_GRID_MIN:
+            # Celda del tamaño del mayor contenedor expandido por el margen
+            grid = SpatialIndex(max(
+                max(x2 - x1, y2 - y1) + 2 * MARGIN
+                for (x1, y1, x2, y2, _) in container_bboxes
+            ))
+            for idx, (x1, y1, x2, y2, _) in enumerate(container_bboxes):
+                grid.insert((x1 - MARGIN, y1 - MARGIN, x2 + MARGIN, y2 + MARGIN), idx)
+
+        # For each free element, check overlap with containers (in list order)
+        # and shift if needed. After a shift, only containers later in the
+        # list are re-checked against the updated position.
         adjustments = 0
         for elem in free_elements:
             if 'x' not in elem or 'y' not in elem:
@@ -213,17 +257,37 @@ class AutoLayoutPositioner:
             ey = elem['y']
             ew, eh = self.sizing.get_element_size(elem)
 
-            for (cx1, cy1, cx2, cy2, cid) in container_bboxes:
-                # Check overlap (with margin)
-                if (ex < cx2 + MARGIN and ex + ew > cx1 - MARGIN and
-                        ey < cy2 + MARGIN and ey + eh > cy1 - MARGIN):
-                    # Shift element below the container
-                    old_y = elem['y']
-                    elem['y'] = cy2 + MARGIN
-                    adjustments += 1
+            last = -1
+            while True:
+                if grid is None:
+                    candidates = range(last + 1, n_containers)
+                else:
+                    # Índices únicos posteriores a last, en orden de lista
+                    candidates = sorted({
+                        idx for idx in grid.candidates((ex, ey, ex + ew, ey + eh))
+                        if idx > last
+                    })
+
+                hit = -1
+                for idx in candidates:
+                    cx1, cy1, cx2, cy2, cid = container_bboxes[idx]
+                    # Check overlap (with margin)
+                    if (ex < cx2 + MARGIN and ex + ew > cx1 - MARGIN and
+                            ey < cy2 + MARGIN and ey + eh > cy1 - MARGIN):
+                        hit = idx
+                        break
+                if hit < 0:
+                    break
+
+                # Shift element below the container
+                old_y = elem['y']
+                elem['y'] = cy2 + MARGIN
+                adjustments += 1
+                if debug_enabled:
                     logger.debug(f"    {elem['id']}: Y {old_y:.1f} → {elem['y']:.1f} (evitar {cid})")
-                    # Re-check with updated position
-                    ey = elem['y']
+                # Re-check with updated position
+                ey = elem['y']
+                last = hit
 
         logger.debug(f"  Ajustes realizados: {adjustments}")
         logger.debug("[FIN AJUSTE]\n")
@@ -247,31 +311,27 @@ class AutoLayoutPositioner:
             layout: Layout con topological_levels calculados
             elements: Elementos sin coordenadas a posicionar
         """
+        topo_levels_get = layout.topological_levels.get
+
         # 1. Agrupar por nivel topológico (element dicts, not IDs)
-        by_level = {}
+        by_level = defaultdict(list)
         for elem in elements:
-            level = layout.topological_levels.get(elem['id'], 0)
-            if level not in by_level:
-                by_level[level] = []
-            by_level[level].append(elem)
+            by_level[topo_levels_get(elem['id'], 0)].append(elem)
 
         if not by_level:
             return
 
+        # Ordenar niveles una sola vez: el dict conserva orden de inserción,
+        # así que el resto del algoritmo itera by_level directamente
+        by_level = {level_num: by_level[level_num] for level_num in sorted(by_level)}
+
         # Build directed graphs for barycenter (use resolved connections)
         resolved_conns = getattr(layout, '_resolved_primary_connections', None) or layout.connections
-        elem_ids = {e['id'] for e in elements}
-        outgoing = {e['id']: [] for e in elements}
-        incoming = {e['id']: [] for e in elements}
-        for conn in resolved_conns:
-            f, t = conn['from'], conn['to']
-            if f in elem_ids and t in elem_ids:
-                outgoing[f].append(t)
-                incoming[t].append(f)
+        outgoing, incoming = self.graph_analyzer.build_directed_graph(elements, resolved_conns)
 
         # Centrality scores (use resolved connections)
         centrality = self.graph_analyzer.calculate_centrality_scores(
-            elements, resolved_conns, layout.topological_levels
+            elements, resolved_conns, layout.topological_levels, (outgoing, incoming)
         )
 
         # 2. Barycenter ordering (reorder elements within each level)
@@ -279,8 +339,8 @@ class AutoLayoutPositioner:
 
         # 3. Assign abstract positions (index within level)
         abstract_positions = {}
-        for level_num in sorted(by_level.keys()):
-            for idx, elem in enumerate(by_level[level_num]):
+        for level_num, level_elems in by_level.items():
+            for idx, elem in enumerate(level_elems):
                 abstract_positions[elem['id']] = (float(idx), float(level_num))
 
         # 4. Optimize abstract positions (layer-offset bisection)
@@ -302,8 +362,7 @@ class AutoLayoutPositioner:
 
         # Compute global X scale
         global_x_scale = SPACING_XLARGE  # 120px minimum
-        for level_num in sorted(by_level.keys()):
-            level_elems = by_level[level_num]
+        for level_elems in by_level.values():
             if len(level_elems) < 2:
                 continue
             items = sorted(
@@ -324,16 +383,16 @@ class AutoLayoutPositioner:
         # Assign Y positions per level
         current_y = TOP_MARGIN
         level_y = {}
-        for level_num in sorted(by_level.keys()):
+        for level_num, level_elems in by_level.items():
             level_y[level_num] = current_y
-            max_h = max((e.get('height', ICON_HEIGHT) for e in by_level[level_num]), default=ICON_HEIGHT)
+            max_h = max((e.get('height', ICON_HEIGHT) for e in level_elems), default=ICON_HEIGHT)
             current_y += max_h + VERTICAL_SPACING
 
         # Assign real X, Y
         for elem in elements:
             eid = elem['id']
             ax = abstract_positions[eid][0]
-            level_num = layout.topological_levels.get(eid, 0)
+            level_num = topo_levels_get(eid, 0)
             elem['x'] = (ax + abs_x_shift) * global_x_scale + LEFT_MARGIN
             elem['y'] = level_y.get(level_num, TOP_MARGIN)
 
@@ -358,77 +417,64 @@ class AutoLayoutPositioner:
         Reorder elements within each level using barycenter heuristic
         to minimize edge crossings. Modifies by_level in-place.
 
+        by_level must be keyed in ascending level order (insertion order).
+
         2 iterations of forward + backward passes with centrality blending.
         """
-        sorted_levels = sorted(by_level.keys())
+        sorted_levels = list(by_level)
         if len(sorted_levels) < 2:
             return
 
-        # Track positions (index within level)
+        # Track positions (index within level) and level index per element
         positions = {}
-        for level_num in sorted_levels:
+        level_index = {}
+        for i, level_num in enumerate(sorted_levels):
             for idx, elem in enumerate(by_level[level_num]):
                 positions[elem['id']] = idx
+                level_index[elem['id']] = i
+
+        # Levels never change during reordering, so neighbors in the adjacent
+        # levels and centrality blend factors are computed once for all passes
+        parents_above = {}
+        children_below = {}
+        alphas = {}
+        for eid, i in level_index.items():
+            parents_above[eid] = [p for p in incoming.get(eid, []) if level_index.get(p) == i - 1]
+            children_below[eid] = [c for c in outgoing.get(eid, []) if level_index.get(c) == i + 1]
+            score = centrality.get(eid, 0.0)
+            alphas[eid] = min(0.6, score * 3.5) if score > 0 else 0.0
+
+        def reorder_level(level_elems, neighbors):
+            center = (len(level_elems) - 1) / 2.0
+            barycenters = {}
+            for elem in level_elems:
+                eid = elem['id']
+                adjacent = neighbors[eid]
+                if adjacent:
+                    bc_conn = sum(positions[n] for n in adjacent) / len(adjacent)
+                else:
+                    bc_conn = center
+
+                # Blend with centrality
+                alpha = alphas[eid]
+                barycenters[eid] = (1.0 - alpha) * bc_conn + alpha * center
+
+            level_elems.sort(key=lambda e: barycenters[e['id']])
+            for idx, elem in enumerate(level_elems):
+                positions[elem['id']] = idx
 
         for _iteration in range(2):
-            # Forward pass (top to bottom)
-            for i in range(1, len(sorted_levels)):
-                level_num = sorted_levels[i]
-                prev_level_num = sorted_levels[i - 1]
-                prev_ids = {e['id'] for e in by_level[prev_level_num]}
+            # Forward pass (top to bottom): parents in previous level
+            for level_num in sorted_levels[1:]:
                 level_elems = by_level[level_num]
+                if len(level_elems) >= 2:
+                    reorder_level(level_elems, parents_above)
 
-                if len(level_elems) < 2:
-                    continue
-
-                center = (len(level_elems) - 1) / 2.0
-                barycenters = {}
-                for elem in level_elems:
-                    eid = elem['id']
-                    # Parents in previous level
-                    parents = [p for p in incoming.get(eid, []) if p in prev_ids]
-                    if parents:
-                        bc_conn = sum(positions[p] for p in parents) / len(parents)
-                    else:
-                        bc_conn = center
-
-                    # Blend with centrality
-                    score = centrality.get(eid, 0.0)
-                    alpha = min(0.6, score * 3.5) if score > 0 else 0.0
-                    barycenters[eid] = (1.0 - alpha) * bc_conn + alpha * center
-
-                level_elems.sort(key=lambda e: barycenters[e['id']])
-                for idx, elem in enumerate(level_elems):
-                    positions[elem['id']] = idx
-
-            # Backward pass (bottom to top)
-            for i in range(len(sorted_levels) - 2, -1, -1):
-                level_num = sorted_levels[i]
-                next_level_num = sorted_levels[i + 1]
-                next_ids = {e['id'] for e in by_level[next_level_num]}
+            # Backward pass (bottom to top): children in next level
+            for level_num in reversed(sorted_levels[:-1]):
                 level_elems = by_level[level_num]
-
-                if len(level_elems) < 2:
-                    continue
-
-                center = (len(level_elems) - 1) / 2.0
-                barycenters = {}
-                for elem in level_elems:
-                    eid = elem['id']
-                    # Children in next level
-                    children = [c for c in outgoing.get(eid, []) if c in next_ids]
-                    if children:
-                        bc_conn = sum(positions[c] for c in children) / len(children)
-                    else:
-                        bc_conn = center
-
-                    score = centrality.get(eid, 0.0)
-                    alpha = min(0.6, score * 3.5) if score > 0 else 0.0
-                    barycenters[eid] = (1.0 - alpha) * bc_conn + alpha * center
-
-                level_elems.sort(key=lambda e: barycenters[e['id']])
-                for idx, elem in enumerate(level_elems):
-                    positions[elem['id']] = idx
+                if len(level_elems) >= 2:
+                    reorder_level(level_elems, children_below)
 
     def _optimize_abstract_positions(
         self,
@@ -457,10 +503,13 @@ class AutoLayoutPositioner:
             adjacency[a].append((b, weight))
             adjacency[b].append((a, weight))
 
-        # Organize by layer
-        layers: Dict[int, List[str]] = {}
-        for level_num in sorted(by_level.keys()):
-            layers[level_num] = [e['id'] for e in by_level[level_num]]
+        # Organize by layer (by_level is already in ascending level order)
+        layers: Dict[int, List[str]] = {
+            level_num: [e['id'] for e in level_elems]
+            for level_num, level_elems in by_level.items()
+        }
+        forward_levels = list(layers)
+        backward_levels = forward_levels[::-1]
 
         # Layer offsets
         base_positions = dict(positions)
@@ -475,14 +524,18 @@ class AutoLayoutPositioner:
                     result[nid] = (x + off, y)
             return result
 
+        sqrt = math.sqrt
+
         def total_distance(pos):
             total = 0.0
             for eid in elem_ids:
+                ex, ey = pos[eid]
                 for neighbor, weight in adjacency.get(eid, []):
                     if eid < neighbor:
-                        dx = pos[eid][0] - pos[neighbor][0]
-                        dy = pos[eid][1] - pos[neighbor][1]
-                        total += weight * math.sqrt(dx * dx + dy * dy)
+                        nx, ny = pos[neighbor]
+                        dx = ex - nx
+                        dy = ey - ny
+                        total += weight * sqrt(dx * dx + dy * dy)
             return total
 
         optimized = apply_offsets()
@@ -492,13 +545,13 @@ class AutoLayoutPositioner:
             moved = False
 
             # Forward pass
-            for level in sorted(layers.keys()):
+            for level in forward_levels:
                 if self._optimize_layer_offset(level, layers, base_positions, optimized, adjacency, layer_offsets):
                     moved = True
                     optimized = apply_offsets()
 
             # Backward pass
-            for level in sorted(layers.keys(), reverse=True):
+            for level in backward_levels:
                 if self._optimize_layer_offset(level, layers, base_positions, optimized, adjacency, layer_offsets):
                     moved = True
                     optimized = apply_offsets()
@@ -527,9 +580,11 @@ class AutoLayoutPositioner:
         if not layer_nodes:
             return False
 
-        # Collect derivative terms (only cross-layer edges)
+        # Collect derivative terms (only cross-layer edges).
+        # dy is constant while the layer slides horizontally, so dy² is
+        # computed once here instead of on every derivative evaluation.
         layer_set = set(layer_nodes)
-        terms = []  # (a, dy, weight)
+        terms = []  # (a, dy², weight)
         for nid in layer_nodes:
             if nid not in base_positions:
                 continue
@@ -540,36 +595,43 @@ class AutoLayoutPositioner:
                 if neighbor not in current_positions:
                     continue
                 x_other, y2 = current_positions[neighbor]
-                terms.append((bx - x_other, y1 - y2, float(weight)))
+                dy = y1 - y2
+                terms.append((bx - x_other, dy * dy, float(weight)))
 
         if not terms:
             return False
 
         current_offset = layer_offsets.get(level, 0.0)
 
+        sqrt = math.sqrt
+
         def derivative(offset):
             d = 0.0
-            for a, dy, w in terms:
+            for a, dy2, w in terms:
                 dx = a + offset
-                denom = math.sqrt(dx * dx + dy * dy)
+                denom = sqrt(dx * dx + dy2)
                 if denom == 0:
                     continue
                 d += w * (dx / denom)
             return d
 
-        # Find bracket
+        # Find bracket (keep the derivative at each end to avoid re-evaluating it)
         low = current_offset - 20.0
         high = current_offset + 20.0
+        d_low = derivative(low)
         for _ in range(8):
-            if derivative(low) <= 0:
+            if d_low <= 0:
                 break
             low -= (high - low)
+            d_low = derivative(low)
+        d_high = derivative(high)
         for _ in range(8):
-            if derivative(high) >= 0:
+            if d_high >= 0:
                 break
             high += (high - low)
+            d_high = derivative(high)
 
-        if derivative(low) > 0 or derivative(high) < 0:
+        if d_low > 0 or d_high < 0:
             return False
 
         # Bisection
@@ -602,15 +664,18 @@ class AutoLayoutPositioner:
             layout: Layout con información de prioridades
             elements: Elementos sin coordenadas a posicionar
         """
+        canvas_w = layout.canvas['width']
+        canvas_h = layout.canvas['height']
+        priorities_get = layout.priorities.get
+
         # Agrupar por prioridad
-        by_priority = {0: [], 1: [], 2: []}  # HIGH, NORMAL, LOW
+        by_priority = defaultdict(list)  # 0=HIGH, 1=NORMAL, 2=LOW
         for elem in elements:
-            priority = layout.priorities.get(elem['id'], 1)  # Default: NORMAL
-            by_priority[priority].append(elem)
+            by_priority[priorities_get(elem['id'], 1)].append(elem)  # Default: NORMAL
 
         # Calcular centro del canvas
-        center_x = layout.canvas['width'] / 2
-        center_y = layout.canvas['height'] / 2
+        center_x = canvas_w / 2
+        center_y = canvas_h / 2
 
         # Calcular radios máximos seguros (con margen de 100px)
         max_radius_x = center_x - CANVAS_MARGIN_LARGE  # Margen desde centro hasta borde (1.25x ICON_WIDTH)
@@ -664,20 +729,17 @@ class AutoLayoutPositioner:
 
         # Grid sqrt(n) × sqrt(n)
         cols = int(math.ceil(math.sqrt(n)))
+        rows = (n + cols - 1) // cols
 
-        for i, elem in enumerate(elements):
-            row = i // cols
-            col = i % cols
+        # Centrar grid (origen y medio spacing son invariantes del bucle)
+        origin_x = cx - cols * spacing / 2
+        origin_y = cy - rows * spacing / 2
+        half_spacing = spacing / 2
 
-            # Calcular número de filas necesarias
-            rows = (n + cols - 1) // cols
-
-            # Centrar grid
-            grid_width = cols * spacing
-            grid_height = rows * spacing
-
-            elem['x'] = cx - grid_width / 2 + col * spacing + spacing / 2
-            elem['y'] = cy - grid_height / 2 + row * spacing + spacing / 2
+        for i, elem in enumerate(elements):
+            row, col = divmod(i, cols)
+            elem['x'] = origin_x + col * spacing + half_spacing
+            elem['y'] = origin_y + row * spacing + half_spacing
 
     def _position_ring(
         self,
@@ -699,11 +761,13 @@ class AutoLayoutPositioner:
         if n == 0:
             return
 
-        angle_step = 2 * math.pi / n
+        cos = math.cos
+        sin = math.sin
+        angle_step = math.tau / n
         for i, elem in enumerate(elements):
             angle = i * angle_step
-            elem['x'] = cx + radius * math.cos(angle)
-            elem['y'] = cy + radius * math.sin(angle)
+            elem['x'] = cx + radius * cos(angle)
+            elem['y'] = cy + radius * sin(angle)
 
     def _calculate_x_only(self, layout: Layout, elements: List[dict]):
         """
@@ -718,31 +782,27 @@ class AutoLayoutPositioner:
             elements: Elementos con Y pero sin X
         """
         # Agrupar por nivel (Y similar)
-        by_level = {}
+        # Agrupación inline (equivalente a _find_level_for_y, sin despacho por elemento)
+        by_level = defaultdict(list)
         for elem in elements:
-            level = self._find_level_for_y(elem['y'])
-            if level not in by_level:
-                by_level[level] = []
-            by_level[level].append(elem)
+            by_level[int(elem['y'] / _LEVEL_BAND_HEIGHT)].append(elem)
+
+        spacing_between = SPACING_SMALL
+        canvas_w = layout.canvas['width']
 
         # Distribuir horizontalmente en cada nivel
         for level, elems in by_level.items():
             # Obtener anchos reales
-            widths = []
-            for elem in elems:
-                width, height = self.sizing.get_element_size(elem)
-                widths.append(width)
+            widths = [self.sizing.get_element_size(elem)[0] for elem in elems]
 
             # Calcular ancho total con spacing entre elementos
-            spacing_between = SPACING_SMALL
             total_width = sum(widths) + (len(elems) - 1) * spacing_between
-            start_x = (layout.canvas['width'] - total_width) / 2
+            current_x = (canvas_w - total_width) / 2
 
             # Posicionar considerando anchos reales
-            current_x = start_x
-            for i, elem in enumerate(elems):
+            for elem, width in zip(elems, widths):
                 elem['x'] = current_x
-                current_x += widths[i] + spacing_between
+                current_x += width + spacing_between
 
     def _calculate_y_only(self, layout: Layout, elements: List[dict]):
         """
@@ -756,17 +816,19 @@ class AutoLayoutPositioner:
             layout: Layout con información de prioridades
             elements: Elementos con X pero sin Y
         """
+        canvas_h = layout.canvas['height']
+        priorities_get = layout.priorities.get
+
         # Agrupar por prioridad
-        by_priority = {0: [], 1: [], 2: []}
+        by_priority = defaultdict(list)
         for elem in elements:
-            priority = layout.priorities.get(elem['id'], 1)
-            by_priority[priority].append(elem)
+            by_priority[priorities_get(elem['id'], 1)].append(elem)
 
         # HIGH → top, NORMAL → middle, LOW → bottom
         level_y = {
-            0: layout.canvas['height'] * 0.25,  # HIGH
-            1: layout.canvas['height'] * 0.50,  # NORMAL
-            2: layout.canvas['height'] * 0.75   # LOW
+            0: canvas_h * 0.25,  # HIGH
+            1: canvas_h * 0.50,  # NORMAL
+            2: canvas_h * 0.75   # LOW
         }
 
         for priority, elems in by_priority.items():
@@ -785,34 +847,38 @@ class AutoLayoutPositioner:
         Returns:
             int: Nivel (0, 1, 2, ...)
         """
-        return int(y / 80)
+        return int(y / _LEVEL_BAND_HEIGHT)
 
     def _analyze_container_hierarchy(self, layout: Layout) -> ContainerHierarchy:
         """
         Analiza jerarquía de contenedores y retorna orden de resolución.
 
+        El orden bottom-up se guarda en layout._container_order para que
+        _propagate_coordinates_to_contained lo reutilice (en reversa).
+
         Retorna:
             ContainerHierarchy con orden bottom-up (hijos antes que padres)
         """
-        containers = [e for e in layout.elements if 'contains' in e]
+        container_ids = layout.container_ids
+        containers = [e for e in layout.elements if e['id'] in container_ids]
 
         if not containers:
+            layout._container_order = []
             return ContainerHierarchy([], {}, [])
 
         # Construir grafo de contención
         hierarchy = {}
         for container in containers:
             children = []
-            for contained_ref in container['contains']:
-                child_id = contained_ref['id'] if isinstance(contained_ref, dict) else contained_ref
-                child = layout.elements_by_id.get(child_id)
-                if child and 'contains' in child:
+            for child_id in layout.container_children[container['id']]:
+                if child_id in container_ids:
                     # Es un contenedor anidado
                     children.append(child_id)
             hierarchy[container['id']] = children
 
         # Calcular orden bottom-up (DFS post-order)
         order = self._topological_sort_containers(hierarchy)
+        layout._container_order = order
 
         return ContainerHierarchy(containers, hierarchy, order)
 
@@ -859,8 +925,10 @@ class AutoLayoutPositioner:
             layout: Layout con elements_by_id
             container: Contenedor a resolver
         """
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
         # Obtener elementos contenidos
-        contained_ids = [extract_item_id(ref) for ref in container['contains']]
+        contained_ids = layout.container_children[container['id']]
         contained_elements = [layout.elements_by_id[id] for id in contained_ids if id in layout.elements_by_id]
 
         if not contained_elements:
@@ -892,12 +960,7 @@ class AutoLayoutPositioner:
             elem = contained_elements[0]
 
             # Calcular espacio del header del contenedor
-            header_height = 0
-            if container.get('label'):
-                lines = container['label'].split('\n')
-                label_height = len(lines) * TEXT_LINE_HEIGHT  # 18px por línea
-                icon_height = CONTAINER_ICON_HEIGHT  # Altura del icono del contenedor
-                header_height = max(CONTAINER_ICON_HEIGHT, label_height)
+            header_height = self._header_height(container)
 
             # Obtener tamaño del elemento
             elem_width = elem.get('width', ICON_WIDTH)
@@ -919,20 +982,39 @@ class AutoLayoutPositioner:
             elem['_local_x'] = centered_x
             elem['_local_y'] = centered_y
 
-            logger.debug(f"  [CENTRADO] Elemento único re-centrado: ({centered_x:.1f}, {centered_y:.1f})")
-            logger.debug(f"    header_height={header_height:.1f}, content_area={content_area_height:.1f}")
+            if debug_enabled:
+                logger.debug(f"  [CENTRADO] Elemento único re-centrado: ({centered_x:.1f}, {centered_y:.1f})")
+                logger.debug(f"    header_height={header_height:.1f}, content_area={content_area_height:.1f}")
 
         # LOG: Información del contenedor resuelto
-        logger.debug(f"\n[CONTENEDOR RESUELTO] {container['id']}")
-        logger.debug(f"  Dimensiones: {min_width:.1f} x {min_height:.1f}")
-        if container.get('label'):
-            lines = container['label'].split('\n')
-            label_height = len(lines) * TEXT_LINE_HEIGHT + 10
-            logger.debug(f"  Espacio etiqueta: {label_height}px (arriba)")
-        logger.debug(f"  Elementos internos: {len(contained_elements)}")
-        for elem in contained_elements:
-            logger.debug(f"    - {elem['id']}: local({elem.get('_local_x', 0):.1f}, {elem.get('_local_y', 0):.1f}) "
-                        f"size({elem.get('width', ICON_WIDTH):.1f} x {elem.get('height', ICON_HEIGHT):.1f})")
+        if debug_enabled:
+            logger.debug(f"\n[CONTENEDOR RESUELTO] {container['id']}")
+            logger.debug(f"  Dimensiones: {min_width:.1f} x {min_height:.1f}")
+            if container.get('label'):
+                label_height = (container['label'].count('\n') + 1) * TEXT_LINE_HEIGHT + 10
+                logger.debug(f"  Espacio etiqueta: {label_height}px (arriba)")
+            logger.debug(f"  Elementos internos: {len(contained_elements)}")
+            for elem in contained_elements:
+                logger.debug(f"    - {elem['id']}: local({elem.get('_local_x', 0):.1f}, {elem.get('_local_y', 0):.1f}) "
+                            f"size({elem.get('width', ICON_WIDTH):.1f} x {elem.get('height', ICON_HEIGHT):.1f})")
+
+    def _header_height(self, container: dict) -> float:
+        """
+        Calcula la altura del header de un contenedor (icono + etiqueta).
+
+        Cuenta saltos de línea en vez de dividir la etiqueta en líneas.
+
+        Args:
+            container: Contenedor
+
+        Returns:
+            float: max(CONTAINER_ICON_HEIGHT, líneas * TEXT_LINE_HEIGHT), o 0 sin etiqueta
+        """
+        label = container.get('label')
+        if not label:
+            return 0
+        label_height = (label.count('\n') + 1) * TEXT_LINE_HEIGHT  # 18px por línea
+        return max(CONTAINER_ICON_HEIGHT, label_height)
 
     def _layout_contained_elements_locally(self, container: dict, elements: List[dict]):
         """
@@ -949,62 +1031,51 @@ class AutoLayoutPositioner:
         padding = container.get('padding', CONTAINER_PADDING)
 
         # Calcular espacio del header del contenedor
-        header_height = 0
-        if container.get('label'):
-            label_text = container['label']
-            lines = label_text.split('\n')
-            label_height = len(lines) * TEXT_LINE_HEIGHT  # 18px por línea
-            icon_height = CONTAINER_ICON_HEIGHT  # Altura del icono del contenedor
-            header_height = max(CONTAINER_ICON_HEIGHT, label_height)
+        header_height = self._header_height(container)
 
         # Posición Y inicial para elementos = header + padding_mid
         start_y = header_height + padding
 
-        # Filtrar por scope
-        full_elements = []
-        for elem in elements:
-            scope = self._get_scope(elem, container)
-            if scope == 'full':
-                full_elements.append(elem)
+        # Filtrar por scope (mapa id -> scope construido una vez por contenedor)
+        scopes = self._scopes_by_id(container)
+        full_elements = [
+            elem for elem in elements
+            if scopes.get(elem['id'], 'full') == 'full'
+        ]
 
         # Layout para elementos "full" (distribución interna simple)
         if full_elements:
             # Grid simple basado en número de elementos
             n = len(full_elements)
-            if n == 1:
-                cols = 1
-            elif n <= 4:
-                cols = 2
-            else:
-                cols = int(n ** 0.5) + 1
+            cols = _GRID_COLS[n] if n < _GRID_COLS_TABLE_SIZE else math.isqrt(n) + 1
 
             spacing = GRID_SPACING_SMALL
 
             for i, elem in enumerate(full_elements):
-                row = i // cols
-                col = i % cols
+                row, col = divmod(i, cols)
                 elem['_local_x'] = padding + col * (ICON_WIDTH + spacing)
                 elem['_local_y'] = start_y + row * (ICON_HEIGHT + spacing)
 
-    def _get_scope(self, elem: dict, container: dict) -> str:
+    def _scopes_by_id(self, container: dict) -> Dict[str, str]:
         """
-        Obtiene el scope de un elemento dentro de un contenedor.
+        Construye el mapa de scopes de los elementos de un contenedor.
+
+        Reemplaza la búsqueda lineal en 'contains' por cada elemento. Si un
+        ID aparece más de una vez, gana la primera referencia.
 
         Args:
-            elem: Elemento
             container: Contenedor padre
 
         Returns:
-            'full' o 'border'
+            Dict[str, str]: {element_id: 'full' o 'border'}
         """
-        # Buscar en las referencias del contenedor
+        scopes = {}
         for ref in container.get('contains', []):
-            ref_id = extract_item_id(ref)
-            if ref_id == elem['id']:
-                if isinstance(ref, dict):
-                    return ref.get('scope', 'full')
-                return 'full'
-        return 'full'
+            if isinstance(ref, dict):
+                scopes.setdefault(ref['id'], ref.get('scope', 'full'))
+            else:
+                scopes.setdefault(ref, 'full')
+        return scopes
 
     def _calculate_container_bounds(self, elements: List[dict], padding: float, container: dict = None) -> tuple:
         """
@@ -1029,26 +1100,29 @@ class AutoLayoutPositioner:
             max_x = float('-inf')
             max_y = float('-inf')
 
+            # Comparaciones directas en vez de min()/max() por elemento
             for elem in elements:
                 local_x = elem.get('_local_x', 0)
                 local_y = elem.get('_local_y', 0)
-                elem_width = elem.get('width', ICON_WIDTH)
-                elem_height = elem.get('height', ICON_HEIGHT)
 
-                min_x = min(min_x, local_x)
-                min_y = min(min_y, local_y)
-                max_x = max(max_x, local_x + elem_width)
+                if local_x < min_x:
+                    min_x = local_x
+                if local_y < min_y:
+                    min_y = local_y
+                right = local_x + elem.get('width', ICON_WIDTH)
+                if right > max_x:
+                    max_x = right
 
                 # Considerar también el espacio de la etiqueta del elemento (si existe)
-                elem_bottom = local_y + elem_height
-                if elem.get('label'):
-                    # Calcular altura real de la etiqueta basándose en número de líneas
-                    label_lines = elem['label'].split('\n')
-                    label_height = len(label_lines) * 18  # 18px por línea
-                    # La etiqueta está típicamente 15px debajo del ícono
-                    elem_bottom += LABEL_OFFSET_VERTICAL + label_height  # offset + altura de etiqueta
+                elem_bottom = local_y + elem.get('height', ICON_HEIGHT)
+                label = elem.get('label')
+                if label:
+                    # Altura real de la etiqueta según número de líneas (18px por línea);
+                    # la etiqueta está típicamente 15px debajo del ícono
+                    elem_bottom += LABEL_OFFSET_VERTICAL + (label.count('\n') + 1) * 18
 
-                max_y = max(max_y, elem_bottom)
+                if elem_bottom > max_y:
+                    max_y = elem_bottom
 
             # Calcular dimensiones del contenido (sin padding aún)
             content_width = max_x - min_x
@@ -1066,14 +1140,9 @@ class AutoLayoutPositioner:
         header_height = 0
 
         if container and 'label' in container:
-            label_text = container['label']
-            lines = label_text.split('\n')
-            max_line_len = max(len(line) for line in lines) if lines else 0
+            num_lines, max_line_len = label_line_metrics(container['label'])
             label_width = max_line_len * TEXT_CHAR_WIDTH  # 8px por carácter
-            label_height = len(lines) * TEXT_LINE_HEIGHT  # 18px por línea
-
-            # El icono del contenedor tiene 50px de altura
-            icon_height = CONTAINER_ICON_HEIGHT
+            label_height = num_lines * TEXT_LINE_HEIGHT  # 18px por línea
 
             # El header ocupa el máximo entre icono y etiqueta
             header_height = max(CONTAINER_ICON_HEIGHT, label_height)
@@ -1107,26 +1176,17 @@ class AutoLayoutPositioner:
         Returns:
             Lista de elementos primarios
         """
-        primary = []
-
-        # Todos los IDs contenidos
-        contained_ids = set()
-        for elem in layout.elements:
-            if 'contains' in elem:
-                for ref in elem['contains']:
-                    ref_id = extract_item_id(ref)
-                    contained_ids.add(ref_id)
+        # Índices de contención mantenidos por el Layout (ver
+        # Layout.rebuild_containment_index): aquí solo se filtra en una pasada
+        contained_ids = layout.element_to_container
+        container_ids = layout.container_ids
 
         # Contenedores resueltos + elementos sin padre
-        for elem in layout.elements:
-            if 'contains' in elem and elem.get('_resolved'):
-                # Contenedor resuelto → primario
-                primary.append(elem)
-            elif elem['id'] not in contained_ids:
-                # No está contenido → primario
-                primary.append(elem)
-
-        return primary
+        return [
+            elem for elem in layout.elements
+            if (elem['id'] in container_ids and elem.get('_resolved'))
+            or elem['id'] not in contained_ids
+        ]
 
     def _propagate_coordinates_to_contained(self, layout: Layout):
         """
@@ -1134,35 +1194,47 @@ class AutoLayoutPositioner:
 
         Coordenada_global = Contenedor(x,y) + Espacio_etiqueta + Offset_local
 
+        Recorre los contenedores top-down (reverso del orden bottom-up calculado
+        en _analyze_container_hierarchy), de modo que un contenedor anidado ya
+        tiene coordenadas globales cuando se propagan las de sus hijos.
+
         Args:
             layout: Layout con contenedores posicionados
         """
-        for container in layout.elements:
-            if 'contains' in container and container.get('x') is not None:
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+        container_order = getattr(layout, '_container_order', None)
+        if container_order is None:
+            container_order = self._analyze_container_hierarchy(layout).order
+
+        elements_by_id = layout.elements_by_id
+        container_children = layout.container_children
+
+        for container_id in reversed(container_order):
+            container = elements_by_id[container_id]
+            if container.get('x') is not None:
                 container_x = container['x']
                 container_y = container['y']
 
                 # LOG: Conversión de coordenadas
-                logger.debug(f"\n[PROPAGACION COORDENADAS] {container['id']}")
-                logger.debug(f"  Contenedor en: ({container_x:.1f}, {container_y:.1f})")
-                logger.debug(f"  Conversión local -> global:")
+                if debug_enabled:
+                    logger.debug(f"\n[PROPAGACION COORDENADAS] {container['id']}")
+                    logger.debug(f"  Contenedor en: ({container_x:.1f}, {container_y:.1f})")
+                    logger.debug(f"  Conversión local -> global:")
 
-                for ref in container['contains']:
-                    ref_id = extract_item_id(ref)
-                    elem = layout.elements_by_id.get(ref_id)
+                for ref_id in container_children[container_id]:
+                    elem = elements_by_id.get(ref_id)
                     if elem and '_local_x' in elem:
-                        local_x = elem['_local_x']
-                        local_y = elem['_local_y']
+                        # Leer y limpiar campos temporales en una sola operación
+                        local_x = elem.pop('_local_x')
+                        local_y = elem.pop('_local_y')
 
                         # Convertir coordenadas locales a globales
                         # Las coordenadas locales ya incluyen el espacio del header
                         elem['x'] = container_x + local_x
                         elem['y'] = container_y + local_y
 
-                        logger.debug(f"    {ref_id}: local({local_x:.1f}, {local_y:.1f}) -> "
-                                   f"global({elem['x']:.1f}, {elem['y']:.1f})")
-
-                        # Limpiar campos temporales
-                        del elem['_local_x']
-                        del elem['_local_y']
+                        if debug_enabled:
+                            logger.debug(f"    {ref_id}: local({local_x:.1f}, {local_y:.1f}) -> "
+                                       f"global({elem['x']:.1f}, {elem['y']:.1f})")
 
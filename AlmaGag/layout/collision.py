@@ -8,9 +8,9 @@ Este módulo detecta colisiones entre:
 - Etiquetas de íconos vs etiquetas de otros íconos
 """
 
+from operator import itemgetter
 from typing import List, Tuple
 from AlmaGag.layout.geometry import GeometryCalculator
-from AlmaGag.utils import extract_item_id
 
 
 class CollisionDetector:
@@ -38,36 +38,20 @@ class CollisionDetector:
         """
         Verifica si id1 contiene a id2 o viceversa.
 
+        Usa el índice inverso layout.container_parents (O(1) por par) en
+        lugar de recorrer las listas 'contains' de ambos elementos. Un ID
+        listado en varios contenedores queda exento con todos ellos.
+
         Args:
             id1: ID del primer elemento
             id2: ID del segundo elemento
-            layout: Layout con elements_by_id
+            layout: Layout con container_parents
 
         Returns:
             True si hay relación padre-hijo directa
         """
-        elem1 = layout.elements_by_id.get(id1)
-        elem2 = layout.elements_by_id.get(id2)
-
-        # Verificar si elem1 contiene a elem2
-        if elem1 and 'contains' in elem1:
-            contains = [
-                extract_item_id(item)
-                for item in elem1['contains']
-            ]
-            if id2 in contains:
-                return True
-
-        # Verificar si elem2 contiene a elem1
-        if elem2 and 'contains' in elem2:
-            contains = [
-                extract_item_id(item)
-                for item in elem2['contains']
-            ]
-            if id1 in contains:
-                return True
-
-        return False
+        parents_of = layout.container_parents
+        return id1 in parents_of.get(id2, ()) or id2 in parents_of.get(id1, ())
 
     def detect_all_collisions(
         self,
@@ -88,40 +72,41 @@ class CollisionDetector:
                 collision_pairs: [(id1, id2, collision_type), ...]
         """
         bboxes = self._collect_all_bboxes(layout)
-        lines = self._collect_all_lines(layout)
+        line_entries = self._collect_line_entries(layout)
         collision_count = 0
         collision_pairs = []
 
-        # Colisiones entre bboxes
-        for i, (bbox1, type1, id1) in enumerate(bboxes):
-            for j, (bbox2, type2, id2) in enumerate(bboxes):
-                if i >= j:
-                    continue
+        # Colisiones entre bboxes (solo pares que se intersectan, en orden i < j)
+        for i, j in self._intersecting_pairs(bboxes):
+            _, type1, id1 = bboxes[i]
+            _, type2, id2 = bboxes[j]
 
-                # No contar colisión de un ícono con su propia etiqueta
-                if type1 == 'icon' and type2 == 'icon_label' and id1 == id2:
-                    continue
-                if type1 == 'icon_label' and type2 == 'icon' and id1 == id2:
-                    continue
+            # No contar colisión de un ícono con su propia etiqueta
+            if type1 == 'icon' and type2 == 'icon_label' and id1 == id2:
+                continue
+            if type1 == 'icon_label' and type2 == 'icon' and id1 == id2:
+                continue
 
-                # No contar colisión contenedor-hijo (FALSO POSITIVO)
-                if self._is_parent_child_relation(id1, id2, layout):
-                    continue
+            # No contar colisión contenedor-hijo (FALSO POSITIVO)
+            if self._is_parent_child_relation(id1, id2, layout):
+                continue
 
-                # Verificar intersección
-                if self.geometry.rectangles_intersect(bbox1, bbox2):
-                    collision_count += 1
-                    collision_pairs.append((id1, id2, f'{type1}_vs_{type2}'))
+            collision_count += 1
+            collision_pairs.append((id1, id2, f'{type1}_vs_{type2}'))
 
         # Colisiones entre líneas y etiquetas de íconos
         for bbox, bbox_type, bbox_id in bboxes:
             if bbox_type != 'icon_label':
                 continue
+            rx1, ry1, rx2, ry2 = bbox
 
-            for endpoints, conn_key in lines:
+            for endpoints, conn_key, from_id, to_id, bx1, by1, bx2, by2 in line_entries:
                 # No contar colisión si la línea conecta este elemento
-                from_id, to_id = conn_key.split('->')
-                if bbox_id in (from_id, to_id):
+                if bbox_id == from_id or bbox_id == to_id:
+                    continue
+
+                # Rechazo rápido por bbox (mismo test inicial que line_intersects_rect)
+                if bx2 < rx1 or rx2 < bx1 or by2 < ry1 or ry2 < by1:
                     continue
 
                 if self.geometry.line_intersects_rect(endpoints, bbox):
@@ -130,10 +115,49 @@ class CollisionDetector:
 
         return collision_count, collision_pairs
 
+    def _intersecting_pairs(self, bboxes: List[Tuple]) -> List[Tuple[int, int]]:
+        """
+        Encuentra los pares de bboxes que se intersectan usando sweep-line en X.
+
+        Los bboxes se recorren ordenados por x1; cada uno solo se compara
+        contra los bboxes "activos" cuyo x2 aún alcanza su x1, en vez de
+        contra todos (O(N log N + N·activos) en lugar de O(N²)).
+        Misma semántica que GeometryCalculator.rectangles_intersect (bordes
+        que se tocan cuentan como intersección; bbox None nunca intersecta).
+
+        Args:
+            bboxes: Lista de tuplas (bbox, type, id)
+
+        Returns:
+            List[Tuple[int, int]]: Pares (i, j) con i < j, en orden lexicográfico
+        """
+        # Filas planas (x1, y1, x2, y2, índice) construidas una sola vez;
+        # orden estable por x1
+        rows = [
+            (bbox[0], bbox[1], bbox[2], bbox[3], i)
+            for i, (bbox, _, _) in enumerate(bboxes)
+            if bbox is not None
+        ]
+        rows.sort(key=itemgetter(0))
+
+        pairs = []
+        active = []  # [(x2, y1, y2, index)]
+        for x1, y1, x2, y2, j in rows:
+            # Descartar activos que terminan antes de este x1
+            active = [a for a in active if a[0] >= x1]
+            for _, ay1, ay2, i in active:
+                if not (ay2 < y1 or y2 < ay1):
+                    pairs.append((i, j) if i < j else (j, i))
+            active.append((x2, y1, y2, j))
+
+        pairs.sort()
+        return pairs
+
     def count_element_collisions(
         self,
         layout,
-        element_id: str
+        element_id: str,
+        queries: 'ElementQueryCache' = None
     ) -> int:
         """
         Cuenta colisiones de un elemento específico.
@@ -146,6 +170,9 @@ class CollisionDetector:
         Args:
             layout: Layout a evaluar
             element_id: ID del elemento a evaluar
+            queries: Caché de prepare_element_queries() compartido entre
+                consultas mientras los elementos no se muevan (si es None,
+                se usa uno nuevo solo para esta llamada)
 
         Returns:
             int: Número de colisiones del elemento
@@ -159,46 +186,68 @@ class CollisionDetector:
         if 'contains' in elem and not elem.get('_is_container_calculated', False):
             return 0
 
+        if queries is None:
+            queries = self.prepare_element_queries(layout)
+
         count = 0
         icon_bbox = self.geometry.get_icon_bbox(elem)
 
         # Colisiones del ícono con etiquetas de otros
-        for other_id, pos_info in layout.label_positions.items():
-            if other_id == element_id:
-                continue
-            other_elem = layout.elements_by_id.get(other_id)
-            if other_elem:
-                label_bbox = self.geometry.get_label_bbox(other_elem, pos_info[3])
-                if self.geometry.rectangles_intersect(icon_bbox, label_bbox):
-                    count += 1
+        if icon_bbox:
+            ix1, iy1, ix2, iy2 = icon_bbox
+            label_bbox_of = queries.label_bbox
+            for other_id, pos_info in layout.label_positions.items():
+                if other_id == element_id:
+                    continue
+                label_bbox = label_bbox_of(other_id, pos_info[3])
+                if label_bbox:
+                    lx1, ly1, lx2, ly2 = label_bbox
+                    if not (ix2 < lx1 or lx2 < ix1 or iy2 < ly1 or ly2 < iy1):
+                        count += 1
 
         # Colisiones de mi etiqueta con otros íconos y líneas
         if element_id in layout.label_positions:
-            my_label_bbox = self.geometry.get_label_bbox(
-                elem,
+            my_label_bbox = queries.label_bbox(
+                element_id,
                 layout.label_positions[element_id][3]
             )
+            if not my_label_bbox:
+                return count
+            rx1, ry1, rx2, ry2 = my_label_bbox
 
             # Con otros íconos
-            for other_elem in layout.elements:
-                if other_elem['id'] == element_id:
+            for other_id, bx1, by1, bx2, by2 in queries.icons():
+                if other_id == element_id:
                     continue
-                other_icon_bbox = self.geometry.get_icon_bbox(other_elem)
-                if other_icon_bbox and self.geometry.rectangles_intersect(my_label_bbox, other_icon_bbox):
+                if not (rx2 < bx1 or bx2 < rx1 or ry2 < by1 or by2 < ry1):
                     count += 1
 
             # Con líneas de conexión (que no conectan este elemento)
-            for conn in layout.connections:
-                from_id = conn['from']
-                to_id = conn['to']
-                if element_id in (from_id, to_id):
+            for endpoints, _, from_id, to_id, bx1, by1, bx2, by2 in queries.lines():
+                if element_id == from_id or element_id == to_id:
+                    continue
+                if bx2 < rx1 or rx2 < bx1 or by2 < ry1 or ry2 < by1:
                     continue
-                endpoints = self.geometry.get_connection_endpoints(layout, conn)
                 if self.geometry.line_intersects_rect(endpoints, my_label_bbox):
                     count += 1
 
         return count
 
+    def prepare_element_queries(self, layout) -> 'ElementQueryCache':
+        """
+        Crea un caché para consultas repetidas de count_element_collisions.
+
+        Válido mientras no cambien las posiciones de los elementos (solo las
+        de las etiquetas), como durante la reubicación de etiquetas.
+
+        Args:
+            layout: Layout a evaluar
+
+        Returns:
+            ElementQueryCache: Caché perezoso de bboxes de íconos, etiquetas y líneas
+        """
+        return ElementQueryCache(self, layout)
+
     def _collect_all_bboxes(self, layout) -> List[Tuple]:
         """
         Recolecta todos los bounding boxes del diagrama.
@@ -214,24 +263,26 @@ class CollisionDetector:
         """
         bboxes = []
 
-        # Filtrar contenedores SIN dimensiones calculadas
-        # (Contenedores con dimensiones calculadas se tratan como elementos normales)
-        normal_elements = [e for e in layout.elements
-                          if 'contains' not in e or e.get('_is_container_calculated', False)]
+        # Contenedores SIN dimensiones calculadas ya vienen excluidos
+        # (contenedores con dimensiones calculadas se tratan como elementos normales)
+        normal_elements = layout.normal_elements
 
-        # Bboxes de íconos
+        # Bboxes de íconos y de sus etiquetas en una sola pasada; las
+        # etiquetas se acumulan aparte para conservar el orden íconos → etiquetas
+        get_icon_bbox = self.geometry.get_icon_bbox
+        get_label_bbox = self.geometry.get_label_bbox
+        label_positions = layout.label_positions
+        label_bboxes = []
         for elem in normal_elements:
-            bbox = self.geometry.get_icon_bbox(elem)
-            bboxes.append((bbox, 'icon', elem['id']))
+            elem_id = elem['id']
+            bboxes.append((get_icon_bbox(elem), 'icon', elem_id))
 
-        # Bboxes de etiquetas de íconos
-        for elem in normal_elements:
-            if elem['id'] in layout.label_positions:
-                pos_info = layout.label_positions[elem['id']]
-                position = pos_info[3]  # (x, y, anchor, position)
-                bbox = self.geometry.get_label_bbox(elem, position)
+            pos_info = label_positions.get(elem_id)
+            if pos_info is not None:
+                bbox = get_label_bbox(elem, pos_info[3])  # (x, y, anchor, position)
                 if bbox:
-                    bboxes.append((bbox, 'icon_label', elem['id']))
+                    label_bboxes.append((bbox, 'icon_label', elem_id))
+        bboxes.extend(label_bboxes)
 
         # Bboxes de etiquetas de conexiones
         for conn in layout.connections:
@@ -242,22 +293,95 @@ class CollisionDetector:
 
         return bboxes
 
-    def _collect_all_lines(self, layout) -> List[Tuple]:
+    def _collect_line_entries(self, layout) -> List[Tuple]:
         """
-        Recolecta todas las líneas de conexión.
+        Precalcula las líneas de conexión para las pruebas línea vs etiqueta.
 
         Args:
             layout: Layout con conexiones
 
         Returns:
-            List[Tuple]: Lista de tuplas (endpoints, conn_key)
-                endpoints: (x1, y1, x2, y2)
-                conn_key: "from_id->to_id"
+            List[Tuple]: Tuplas (endpoints, conn_key, from_id, to_id,
+                bx1, by1, bx2, by2), donde (bx1, by1, bx2, by2) es el bbox
+                de la línea (permite descartar pares sin llamar a geometry)
         """
-        lines = []
+        entries = []
         for conn in layout.connections:
             endpoints = self.geometry.get_connection_endpoints(layout, conn)
             if endpoints:
-                key = f"{conn['from']}->{conn['to']}"
-                lines.append((endpoints, key))
-        return lines
+                from_id = conn['from']
+                to_id = conn['to']
+                x1, y1, x2, y2 = endpoints
+                entries.append((
+                    endpoints, f"{from_id}->{to_id}", from_id, to_id,
+                    min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+                ))
+        return entries
+
+
+class ElementQueryCache:
+    """
+    Geometría compartida entre llamadas a count_element_collisions.
+
+    Los bboxes de íconos y las líneas de conexión solo dependen de las
+    posiciones de los elementos; los bboxes de etiquetas, además, de la
+    posición elegida ('top', 'bottom', ...). Todo se calcula de forma
+    perezosa la primera vez que se necesita.
+    """
+
+    __slots__ = ('_detector', '_layout', '_icons', '_lines', '_label_bboxes')
+
+    def __init__(self, detector: CollisionDetector, layout):
+        """
+        Args:
+            detector: CollisionDetector que realiza las consultas
+            layout: Layout cuyas posiciones de elementos quedan fijas
+        """
+        self._detector = detector
+        self._layout = layout
+        self._icons = None
+        self._lines = None
+        self._label_bboxes = {}
+
+    def icons(self) -> List[Tuple]:
+        """
+        Returns:
+            List[Tuple]: (id, x1, y1, x2, y2) de cada ícono con bbox
+        """
+        if self._icons is None:
+            get_icon_bbox = self._detector.geometry.get_icon_bbox
+            self._icons = [
+                (elem['id'],) + bbox
+                for elem in self._layout.elements
+                for bbox in (get_icon_bbox(elem),)
+                if bbox
+            ]
+        return self._icons
+
+    def lines(self) -> List[Tuple]:
+        """
+        Returns:
+            List[Tuple]: Líneas de conexión (ver CollisionDetector._collect_line_entries)
+        """
+        if self._lines is None:
+            self._lines = self._detector._collect_line_entries(self._layout)
+        return self._lines
+
+    def label_bbox(self, element_id: str, position: str):
+        """
+        Retorna el bbox de la etiqueta de un elemento en una posición dada.
+
+        Args:
+            element_id: ID del elemento
+            position: 'bottom', 'top', 'left', 'right'
+
+        Returns:
+            Optional[Tuple]: (x1, y1, x2, y2) o None si no hay elemento/etiqueta
+        """
+        key = (element_id, position)
+        if key not in self._label_bboxes:
+            elem = self._layout.elements_by_id.get(element_id)
+            self._label_bboxes[key] = (
+                self._detector.geometry.get_label_bbox(elem, position) if elem else None
+            )
+        return self._label_bboxes[key]
@@ -16,7 +16,7 @@ Fecha: 2026-01-09
 
 from typing import Dict, List, Tuple
 from AlmaGag.config import ICON_WIDTH, ICON_HEIGHT
-from AlmaGag.utils import extract_item_id
+from AlmaGag.utils import label_line_metrics
 
 
 class ContainerCalculator:
@@ -41,7 +41,8 @@ class ContainerCalculator:
     def calculate_container_bounds(
         self,
         container: dict,
-        layout
+        layout,
+        label_bboxes: Dict[Tuple[str, str], tuple] = None
     ) -> Tuple[float, float, float, float]:
         """
         Calcula el bounding box de un contenedor basado en sus elementos.
@@ -50,7 +51,9 @@ class ContainerCalculator:
 
         Args:
             container: Elemento contenedor con 'contains'
-            layout: Layout con elements_by_id y label_positions
+            layout: Layout con elements_by_id, container_children y label_positions
+            label_bboxes: Caché opcional {(elem_id, position): bbox} compartido
+                durante una pasada; solo guarda elementos que no son contenedores
 
         Returns:
             Tuple: (x, y, width, height) del contenedor
@@ -65,28 +68,27 @@ class ContainerCalculator:
         # Padding (espacio interno)
         padding = container.get('padding', 10)
 
-        # Encontrar bounds de todos los elementos contenidos (íconos + etiquetas)
-        min_x = float('inf')
-        min_y = float('inf')
-        max_x = float('-inf')
-        max_y = float('-inf')
+        # Encontrar bounds de todos los elementos contenidos (íconos + etiquetas);
+        # se inicializan con el primer elemento válido (None = ninguno aún)
+        min_x = min_y = max_x = max_y = None
 
-        for item in contains:
-            # Soportar formato dict {"id": "...", "scope": "..."} o string directo
-            elem_id = extract_item_id(item)
+        elements_by_id = layout.elements_by_id
+        label_positions = layout.label_positions
+        geometry = self.geometry
 
-            if elem_id not in layout.elements_by_id:
+        # IDs ya normalizados por el Layout (refs string o dict {"id", "scope"}).
+        # Comparaciones directas en vez de min()/max() por elemento
+        for elem_id in layout.container_children[container['id']]:
+            elem = elements_by_id.get(elem_id)
+            if elem is None:
                 continue
 
-            elem = layout.elements_by_id[elem_id]
-
             # Validar que elemento tiene coordenadas
-            if elem.get('x') is None or elem.get('y') is None:
+            elem_x = elem.get('x')
+            elem_y = elem.get('y')
+            if elem_x is None or elem_y is None:
                 continue
 
-            elem_x = elem['x']
-            elem_y = elem['y']
-
             # Obtener tamaño del elemento (considerando hp/wp)
             if self.sizing:
                 elem_w, elem_h = self.sizing.get_element_size(elem)
@@ -94,26 +96,48 @@ class ContainerCalculator:
                 elem_w, elem_h = ICON_WIDTH, ICON_HEIGHT
 
             # Considerar bbox del ícono
-            min_x = min(min_x, elem_x)
-            min_y = min(min_y, elem_y)
-            max_x = max(max_x, elem_x + elem_w)
-            max_y = max(max_y, elem_y + elem_h)
+            if min_x is None:
+                min_x = elem_x
+                min_y = elem_y
+                max_x = elem_x + elem_w
+                max_y = elem_y + elem_h
+            else:
+                if elem_x < min_x:
+                    min_x = elem_x
+                if elem_y < min_y:
+                    min_y = elem_y
+                if elem_x + elem_w > max_x:
+                    max_x = elem_x + elem_w
+                if elem_y + elem_h > max_y:
+                    max_y = elem_y + elem_h
 
             # NUEVO v2.2: Considerar TAMBIÉN bbox de la etiqueta del elemento
-            if elem_id in layout.label_positions and self.geometry:
-                pos_info = layout.label_positions[elem_id]
+            pos_info = label_positions.get(elem_id)
+            if pos_info is not None and geometry:
                 position = pos_info[3]  # (x, y, anchor, position)
-                label_bbox = self.geometry.get_label_bbox(elem, position)
+                if label_bboxes is None or 'contains' in elem:
+                    label_bbox = geometry.get_label_bbox(elem, position)
+                else:
+                    # Los hijos que no son contenedores no se mueven durante la pasada
+                    key = (elem_id, position)
+                    if key in label_bboxes:
+                        label_bbox = label_bboxes[key]
+                    else:
+                        label_bbox = label_bboxes[key] = geometry.get_label_bbox(elem, position)
 
                 if label_bbox:
                     lx1, ly1, lx2, ly2 = label_bbox
-                    min_x = min(min_x, lx1)
-                    min_y = min(min_y, ly1)
-                    max_x = max(max_x, lx2)
-                    max_y = max(max_y, ly2)
+                    if lx1 < min_x:
+                        min_x = lx1
+                    if ly1 < min_y:
+                        min_y = ly1
+                    if lx2 > max_x:
+                        max_x = lx2
+                    if ly2 > max_y:
+                        max_y = ly2
 
         # Si no se encontró ningún elemento válido, usar defaults
-        if min_x == float('inf'):
+        if min_x is None:
             x = container.get('x', 0)
             y = container.get('y', 0)
             return (x, y, 200, 150)
@@ -126,13 +150,16 @@ class ContainerCalculator:
         x = min_x - padding
         width = content_width + (2 * padding)
 
+        label = container.get('label')
+        aspect_ratio = container.get('aspect_ratio')
+        if not label and not aspect_ratio:
+            # Ruta rápida: sin header ni aspect_ratio solo queda el padding
+            return (x, min_y - padding, width, (2 * padding) + content_height)
+
         # Calcular espacio del header del contenedor (icono + etiqueta)
         header_height = 0
-        if container.get('label'):
-            label_text = container['label']
-            lines = label_text.split('\n')
-            num_lines = len(lines)
-            max_line_len = max(len(line) for line in lines) if lines else 0
+        if label:
+            num_lines, max_line_len = label_line_metrics(label)
             label_width = max_line_len * 8  # 8px por carácter
             label_height = num_lines * 18  # 18px por línea
 
@@ -160,7 +187,6 @@ class ContainerCalculator:
         y = min_y - padding - header_height
 
         # Aplicar aspect_ratio si se especifica
-        aspect_ratio = container.get('aspect_ratio')
         if aspect_ratio and height > 0:
             current_ratio = width / height
             if current_ratio < aspect_ratio:
@@ -196,14 +222,17 @@ class ContainerCalculator:
         import logging
         logger = logging.getLogger('AlmaGag.ContainerCalculator')
 
-        for elem in layout.elements:
-            if 'contains' not in elem:
-                continue
+        # Bboxes de etiquetas de hijos compartidos entre contenedores
+        label_bboxes = {}
+
+        containers = [e for e in layout.elements if 'contains' in e]
 
+        for elem in containers:
             # Calcular bounds del contenedor (considerando íconos + etiquetas)
             x, y, width, height = self.calculate_container_bounds(
                 elem,
-                layout
+                layout,
+                label_bboxes
             )
 
             if debug:
@@ -7,9 +7,11 @@ Este módulo es stateless y proporciona métodos puros para cálculos geométric
 - Endpoints y centros de conexiones
 - Detección de intersecciones entre rectángulos y líneas
 - Detección de colisiones de etiquetas (v3.0)
+- Índice espacial (grid) para consultas repetidas de colisión
 """
 
 from typing import Tuple, Optional, List
+from AlmaGag.utils import label_line_metrics
 from AlmaGag.config import (
     ICON_WIDTH, ICON_HEIGHT,
     LABEL_OFFSET_BOTTOM, LABEL_OFFSET_TOP, LABEL_OFFSET_SIDE,
@@ -17,6 +19,9 @@ from AlmaGag.config import (
     CONNECTION_BBOX_PADDING
 )
 
+# Lado de celda del grid de SpatialIndex (~2x el tamaño típico de un ícono)
+SPATIAL_INDEX_CELL_SIZE = 200
+
 
 class GeometryCalculator:
     """
@@ -126,9 +131,7 @@ class GeometryCalculator:
         if not label:
             return None
 
-        lines = label.split('\n')
-        num_lines = len(lines)
-        max_line_len = max(len(line) for line in lines)
+        num_lines, max_line_len = label_line_metrics(label)
 
         text_x, text_y, anchor, _ = self.get_text_coords(element, position, num_lines)
 
@@ -276,10 +279,10 @@ class GeometryCalculator:
             return None
 
         key = f"{connection['from']}->{connection['to']}"
-        center = layout.connection_labels.get(
-            key,
-            self.get_connection_center(layout, connection)
-        )
+        # Centro de la línea solo si no hay posición de etiqueta calculada
+        center = layout.connection_labels.get(key)
+        if center is None:
+            center = self.get_connection_center(layout, connection)
         mid_x, mid_y = center
 
         # Estimación: 7px por caracter, 12px altura
@@ -308,18 +311,12 @@ class GeometryCalculator:
         Returns:
             bool: True si se intersectan
         """
-        if rect1 is None or rect2 is None:
-            return False
-
-        x1_1, y1_1, x2_1, y2_1 = rect1
-        x1_2, y1_2, x2_2, y2_2 = rect2
-
-        if x2_1 < x1_2 or x2_2 < x1_1:
-            return False
-        if y2_1 < y1_2 or y2_2 < y1_1:
-            return False
-
-        return True
+        # Una sola expresión: separados en X o en Y => no se intersectan
+        return (
+            rect1 is not None and rect2 is not None
+            and not (rect1[2] < rect2[0] or rect2[2] < rect1[0]
+                     or rect1[3] < rect2[1] or rect2[3] < rect1[1])
+        )
 
     def line_intersects_rect(
         self,
@@ -345,8 +342,16 @@ class GeometryCalculator:
         rx1, ry1, rx2, ry2 = rect
 
         # Primero verificar si el bbox de la línea intersecta el rectángulo
-        line_bbox = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
-        if not self.rectangles_intersect(line_bbox, rect):
+        # (en línea, sin construir la tupla del bbox)
+        if x1 < x2:
+            lx1, lx2 = x1, x2
+        else:
+            lx1, lx2 = x2, x1
+        if y1 < y2:
+            ly1, ly2 = y1, y2
+        else:
+            ly1, ly2 = y2, y1
+        if lx2 < rx1 or rx2 < lx1 or ly2 < ry1 or ry2 < ly1:
             return False
 
         # Para líneas verticales
@@ -359,14 +364,18 @@ class GeometryCalculator:
 
         # Para líneas diagonales, verificar si algún punto del rectángulo
         # está en lados opuestos de la línea
-        def side(px, py):
-            return (x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)
-
-        corners = [(rx1, ry1), (rx2, ry1), (rx2, ry2), (rx1, ry2)]
-        sides = [side(px, py) for px, py in corners]
+        # (producto cruz por esquina, sin closure ni listas intermedias)
+        dx = x2 - x1
+        dy = y2 - y1
+        s1 = dx * (ry1 - y1) - dy * (rx1 - x1)
+        s2 = dx * (ry1 - y1) - dy * (rx2 - x1)
+        s3 = dx * (ry2 - y1) - dy * (rx2 - x1)
+        s4 = dx * (ry2 - y1) - dy * (rx1 - x1)
 
         # Si todas las esquinas están del mismo lado, no hay intersección
-        if all(s > 0 for s in sides) or all(s < 0 for s in sides):
+        if s1 > 0 and s2 > 0 and s3 > 0 and s4 > 0:
+            return False
+        if s1 < 0 and s2 < 0 and s3 < 0 and s4 < 0:
             return False
 
         return True
@@ -394,13 +403,12 @@ class GeometryCalculator:
         """
         # Estimar ancho del texto (6px promedio por carácter para Arial)
         char_width = font_size * 0.6
-        lines = text.split('\n')
-        max_line_length = max(len(line) for line in lines) if lines else 0
+        num_lines, max_line_length = label_line_metrics(text)
         text_width = max_line_length * char_width
 
         # Alto del texto
         line_height = font_size * 1.2
-        text_height = len(lines) * line_height
+        text_height = num_lines * line_height
 
         # Ajustar según anchor
         if anchor == "middle":
@@ -418,10 +426,37 @@ class GeometryCalculator:
 
         return (x1, y1, x2, y2)
 
+    def build_spatial_index(
+        self,
+        elements: List[dict],
+        cell_size: float = SPATIAL_INDEX_CELL_SIZE
+    ) -> 'SpatialIndex':
+        """
+        Construye un grid uniforme con los bboxes de íconos de los elementos.
+
+        Pensado para consultas repetidas (una por etiqueta candidata) mientras
+        las posiciones de los elementos no cambian.
+
+        Args:
+            elements: Lista de elementos con coordenadas
+            cell_size: Lado de cada celda en píxeles
+
+        Returns:
+            SpatialIndex: Índice para label_intersects_elements
+        """
+        index = SpatialIndex(cell_size)
+        get_icon_bbox = self.get_icon_bbox
+        for elem in elements:
+            elem_bbox = get_icon_bbox(elem)
+            if elem_bbox:
+                index.insert(elem_bbox)
+        return index
+
     def label_intersects_elements(
         self,
         label_bbox: Tuple[float, float, float, float],
-        elements: List[dict]
+        elements: List[dict],
+        index: Optional['SpatialIndex'] = None
     ) -> bool:
         """
         Verifica si una etiqueta colisiona con algún elemento.
@@ -429,14 +464,27 @@ class GeometryCalculator:
         Args:
             label_bbox: Bounding box de la etiqueta (x1, y1, x2, y2)
             elements: Lista de elementos con coordenadas
+            index: Índice de build_spatial_index(elements) (opcional); si se
+                pasa, solo se prueban los elementos de las celdas tocadas
 
         Returns:
             bool: True si hay colisión, False si no
         """
+        if label_bbox is None:
+            return False
+
+        if index is not None:
+            return index.intersects(label_bbox)
+
+        # Prueba de intersección en línea (misma semántica que rectangles_intersect)
+        lx1, ly1, lx2, ly2 = label_bbox
+        get_icon_bbox = self.get_icon_bbox
         for elem in elements:
-            elem_bbox = self.get_icon_bbox(elem)
-            if elem_bbox and self.rectangles_intersect(label_bbox, elem_bbox):
-                return True
+            elem_bbox = get_icon_bbox(elem)
+            if elem_bbox:
+                ex1, ey1, ex2, ey2 = elem_bbox
+                if not (lx2 < ex1 or ex2 < lx1 or ly2 < ey1 or ey2 < ly1):
+                    return True
         return False
 
     def label_intersects_labels(
@@ -454,7 +502,101 @@ class GeometryCalculator:
         Returns:
             bool: True si hay colisión, False si no
         """
+        if label_bbox is None:
+            return False
+
+        # Prueba de intersección en línea (misma semántica que rectangles_intersect)
+        lx1, ly1, lx2, ly2 = label_bbox
         for other_bbox in other_labels:
-            if self.rectangles_intersect(label_bbox, other_bbox):
-                return True
+            if other_bbox is not None:
+                ox1, oy1, ox2, oy2 = other_bbox
+                if not (lx2 < ox1 or ox2 < lx1 or ly2 < oy1 or oy2 < ly1):
+                    return True
+        return False
+
+
+class SpatialIndex:
+    """
+    Grid uniforme de bboxes (x1, y1, x2, y2) para consultas de intersección.
+
+    Cada bbox se registra en todas las celdas que cubre; una consulta solo
+    prueba los bboxes de las celdas que toca. Misma semántica que
+    GeometryCalculator.rectangles_intersect (bordes que se tocan cuentan).
+
+    Por defecto cada celda guarda el propio bbox; insert(bbox, item) guarda
+    en su lugar un ítem arbitrario (p.ej. un índice) que candidates()
+    devuelve tal cual.
+    """
+
+    __slots__ = ('cell_size', 'cells')
+
+    def __init__(self, cell_size: float = SPATIAL_INDEX_CELL_SIZE):
+        """
+        Args:
+            cell_size: Lado de cada celda en píxeles
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def insert(self, bbox: Tuple[float, float, float, float], item=None) -> None:
+        """
+        Registra un bbox en las celdas que cubre.
+
+        Args:
+            bbox: (x1, y1, x2, y2)
+            item: Valor a guardar en las celdas (por defecto, el propio bbox)
+        """
+        if item is None:
+            item = bbox
+        size = self.cell_size
+        cells = self.cells
+        x1, y1, x2, y2 = bbox
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                key = (cx, cy)
+                if key in cells:
+                    cells[key].append(item)
+                else:
+                    cells[key] = [item]
+
+    def candidates(self, bbox: Tuple[float, float, float, float]):
+        """
+        Recorre los ítems registrados en las celdas que toca un bbox.
+
+        Un bbox que cubre varias celdas puede aparecer más de una vez; los
+        puntos (x, y, x, y) ocupan una sola celda y aparecen una sola vez.
+
+        Args:
+            bbox: (x1, y1, x2, y2)
+
+        Yields:
+            Ítems candidatos (los bboxes, salvo que se pasara item en insert)
+        """
+        size = self.cell_size
+        cells = self.cells
+        x1, y1, x2, y2 = bbox
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                yield from cells.get((cx, cy), ())
+
+    def intersects(self, bbox: Tuple[float, float, float, float]) -> bool:
+        """
+        Verifica si un bbox intersecta alguno de los registrados.
+
+        Requiere que los ítems sean los propios bboxes (insert sin item).
+
+        Args:
+            bbox: (x1, y1, x2, y2)
+
+        Returns:
+            bool: True si hay intersección
+        """
+        size = self.cell_size
+        cells = self.cells
+        lx1, ly1, lx2, ly2 = bbox
+        for cx in range(int(lx1 // size), int(lx2 // size) + 1):
+            for cy in range(int(ly1 // size), int(ly2 // size) + 1):
+                for ox1, oy1, ox2, oy2 in cells.get((cx, cy), ()):
+                    if not (lx2 < ox1 or ox2 < lx1 or ly2 < oy1 or oy2 < ly1):
+                        return True
         return False
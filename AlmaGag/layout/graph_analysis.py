@@ -9,7 +9,9 @@ del grafo de elementos y conexiones:
 - Cálculo de prioridades automáticas
 """
 
-from typing import Dict, List
+from collections import defaultdict, deque
+from operator import itemgetter
+from typing import Dict, List, Tuple
 from AlmaGag.utils import extract_item_id
 
 
@@ -22,6 +24,12 @@ class GraphAnalyzer:
     """
 
     PRIORITY_ORDER = {'high': 0, 'normal': 1, 'low': 2}
+    PRIORITY_NAMES = {v: k for k, v in PRIORITY_ORDER.items()}
+    # Prioridad automática por número de conexiones (0..3); >= 4 es 'high'
+    AUTO_PRIORITY_BY_DEGREE = (
+        PRIORITY_ORDER['low'], PRIORITY_ORDER['low'],
+        PRIORITY_ORDER['normal'], PRIORITY_ORDER['normal'],
+    )
 
     def build_graph(
         self,
@@ -39,17 +47,51 @@ class GraphAnalyzer:
             Dict[str, List[str]]: {element_id: [connected_ids]}
         """
         graph = {e['id']: [] for e in elements}
+        neighbors_of = graph.get
 
+        # Una sola búsqueda por extremo; se ignoran ids ajenos a elements
         for conn in connections:
             from_id = conn['from']
             to_id = conn['to']
-            if from_id in graph:
-                graph[from_id].append(to_id)
-            if to_id in graph:
-                graph[to_id].append(from_id)
+            from_neighbors = neighbors_of(from_id)
+            if from_neighbors is not None:
+                from_neighbors.append(to_id)
+            to_neighbors = neighbors_of(to_id)
+            if to_neighbors is not None:
+                to_neighbors.append(from_id)
 
         return graph
 
+    def build_directed_graph(
+        self,
+        elements: List[dict],
+        connections: List[dict]
+    ) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """
+        Construye el grafo direccional (salientes y entrantes) desde connections.
+
+        Solo se incluyen aristas con ambos extremos en elements. El resultado
+        puede reutilizarse entre análisis (niveles, centralidad, barycenter).
+
+        Args:
+            elements: Lista de elementos del diagrama
+            connections: Lista de conexiones direccionales
+
+        Returns:
+            Tuple: (outgoing, incoming) como {element_id: [ids]}
+        """
+        outgoing = {e['id']: [] for e in elements}
+        incoming = {e['id']: [] for e in elements}
+
+        for conn in connections:
+            from_id = conn['from']
+            to_id = conn['to']
+            if from_id in outgoing and to_id in outgoing:
+                outgoing[from_id].append(to_id)
+                incoming[to_id].append(from_id)
+
+        return outgoing, incoming
+
     def calculate_topological_levels(
         self,
         elements: List[dict],
@@ -72,15 +114,7 @@ class GraphAnalyzer:
         elem_ids = {e['id'] for e in elements}
 
         # Construir grafo direccional
-        outgoing = {e['id']: [] for e in elements}
-        incoming = {e['id']: [] for e in elements}
-
-        for conn in connections:
-            from_id = conn['from']
-            to_id = conn['to']
-            if from_id in elem_ids and to_id in elem_ids:
-                outgoing[from_id].append(to_id)
-                incoming[to_id].append(from_id)
+        outgoing, incoming = self.build_directed_graph(elements, connections)
 
         # Encontrar raíces (sin incoming edges)
         roots = [e_id for e_id in elem_ids if len(incoming[e_id]) == 0]
@@ -88,25 +122,51 @@ class GraphAnalyzer:
         if not roots:
             roots = [max(outgoing, key=lambda k: len(outgoing[k]))] if outgoing else []
 
-        # Longest-path assignment: propagate levels iteratively
-        # Capped at N iterations to handle cycles safely
+        # Longest-path assignment
         levels = {e_id: 0 for e_id in elem_ids}
         for root in roots:
             levels[root] = 0
 
+        # Acyclic graphs (ignoring self-loops): relax once in Kahn order, O(V+E).
+        # The longest-path fixpoint is unique, so this matches the iterative pass.
+        indegree = {e_id: 0 for e_id in elem_ids}
+        for parent, children in outgoing.items():
+            for child in children:
+                if child != parent:
+                    indegree[child] += 1
+        ready = deque(e_id for e_id in elem_ids if indegree[e_id] == 0)
+        topo_order = []
+        while ready:
+            parent = ready.popleft()
+            topo_order.append(parent)
+            new_level = levels[parent] + 1
+            for child in outgoing[parent]:
+                if child == parent:
+                    continue  # skip self-loops
+                if new_level > levels[child]:
+                    levels[child] = new_level
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+
+        # Cycles: propagate levels iteratively from scratch,
+        # capped at N iterations to handle cycles safely
         n = len(elem_ids)
-        for _round in range(n):
-            changed = False
-            for parent in elem_ids:
-                for child in outgoing.get(parent, []):
-                    if child == parent:
-                        continue  # skip self-loops
-                    new_level = levels[parent] + 1
-                    if new_level > levels[child]:
-                        levels[child] = new_level
-                        changed = True
-            if not changed:
-                break
+        acyclic = len(topo_order) == n
+        if not acyclic:
+            levels = {e_id: 0 for e_id in elem_ids}
+            for _round in range(n):
+                changed = False
+                for parent in elem_ids:
+                    for child in outgoing.get(parent, []):
+                        if child == parent:
+                            continue  # skip self-loops
+                        new_level = levels[parent] + 1
+                        if new_level > levels[child]:
+                            levels[child] = new_level
+                            changed = True
+                if not changed:
+                    break
 
         # Relocate minor source nodes (spouses/in-laws) to co-parent's level.
         # Among source nodes, only those with the largest descendant tree stay
@@ -126,7 +186,20 @@ class GraphAnalyzer:
                             q.append(nb)
                 return len(vis) - 1
 
-            desc_counts = {r: _count_desc(r) for r in roots}
+            if acyclic:
+                # DAG: descendant sets as int bitmasks, built once in reverse
+                # topological order instead of one walk per root
+                bit = {e_id: 1 << i for i, e_id in enumerate(topo_order)}
+                desc = {}
+                for node in reversed(topo_order):
+                    mask = 0
+                    for child in outgoing[node]:
+                        if child != node:
+                            mask |= bit[child] | desc[child]
+                    desc[node] = mask
+                desc_counts = {r: bin(desc[r]).count('1') for r in roots}
+            else:
+                desc_counts = {r: _count_desc(r) for r in roots}
             max_desc = max(desc_counts.values())
             minor_sources = [r for r in roots if desc_counts[r] < max_desc]
 
@@ -141,7 +214,10 @@ class GraphAnalyzer:
                 if co_parent_level is not None:
                     levels[src] = co_parent_level
 
-        # Leaf correction: leaves align to dominant parent's level
+        # Leaf correction: leaves align to dominant parent's level.
+        # Since e_id is itself a leaf, "all siblings are leaves" only depends
+        # on the parent, so it is computed once per parent.
+        parent_has_only_leaves = {}
         for e_id in elem_ids:
             if outgoing.get(e_id):
                 continue  # not a leaf
@@ -151,11 +227,14 @@ class GraphAnalyzer:
             # Check if terminal leaf (all siblings of parent are also leaves)
             is_terminal = True
             for parent in parents:
-                for sibling in outgoing.get(parent, []):
-                    if sibling != e_id and outgoing.get(sibling):
-                        is_terminal = False
-                        break
-                if not is_terminal:
+                only_leaves = parent_has_only_leaves.get(parent)
+                if only_leaves is None:
+                    only_leaves = not any(
+                        outgoing.get(sibling) for sibling in outgoing.get(parent, [])
+                    )
+                    parent_has_only_leaves[parent] = only_leaves
+                if not only_leaves:
+                    is_terminal = False
                     break
 
             max_parent = max(levels[p] for p in parents)
@@ -170,7 +249,8 @@ class GraphAnalyzer:
         self,
         elements: List[dict],
         connections: List[dict],
-        levels: Dict[str, int]
+        levels: Dict[str, int],
+        directed_graph: Tuple[Dict[str, List[str]], Dict[str, List[str]]] = None
     ) -> Dict[str, float]:
         """
         Calcula scores de centralidad basados en grado de conexiones.
@@ -182,27 +262,21 @@ class GraphAnalyzer:
             elements: Lista de elementos
             connections: Lista de conexiones
             levels: Niveles topológicos calculados
+            directed_graph: (outgoing, incoming) de build_directed_graph para
+                los mismos elements/connections (opcional, evita reconstruirlo)
 
         Returns:
             Dict[str, float]: {element_id: centrality_score}
         """
-        elem_ids = {e['id'] for e in elements}
-
-        # Count directed edges
-        outdegree = {e_id: 0 for e_id in elem_ids}
-        indegree = {e_id: 0 for e_id in elem_ids}
-
-        for conn in connections:
-            from_id = conn['from']
-            to_id = conn['to']
-            if from_id in elem_ids and to_id in elem_ids:
-                outdegree[from_id] += 1
-                indegree[to_id] += 1
+        # Count directed edges; las claves del grafo ya son los ids de elements
+        if directed_graph is None:
+            directed_graph = self.build_directed_graph(elements, connections)
+        outgoing, incoming = directed_graph
 
         scores = {}
-        for e_id in elem_ids:
-            w_hijos = max(0, outdegree[e_id] - 1) * 0.10
-            w_fanin = max(0, indegree[e_id] - 1) * 0.15
+        for e_id in outgoing:
+            w_hijos = max(0, len(outgoing[e_id]) - 1) * 0.10
+            w_fanin = max(0, len(incoming[e_id]) - 1) * 0.15
             scores[e_id] = w_hijos + w_fanin
 
         return scores
@@ -237,19 +311,34 @@ class GraphAnalyzer:
                 child_id = extract_item_id(ref)
                 child_to_parent[child_id] = container_id
 
+        # Memo {elem_id: primario o None}: cada nodo se recorre una sola vez
+        resolved_cache = {}
+
         def resolve(elem_id):
             """Walk up containment tree until we find a primary element."""
-            visited = set()
+            if elem_id in resolved_cache:
+                return resolved_cache[elem_id]
+            path = []  # nodos recorridos; la anidación es poco profunda
             current = elem_id
             while current not in primary_ids and current in child_to_parent:
-                if current in visited:
-                    break  # cycle protection
-                visited.add(current)
+                if current in resolved_cache:
+                    result = resolved_cache[current]
+                    break
+                if current in path:
+                    result = None  # cycle protection
+                    break
+                path.append(current)
                 current = child_to_parent[current]
-            return current if current in primary_ids else None
+            else:
+                result = current if current in primary_ids else None
+            # Todo nodo del camino sube hasta el mismo primario
+            for node in path:
+                resolved_cache[node] = result
+            resolved_cache[elem_id] = result
+            return result
 
         # Resolve all connections
-        edge_counts = {}
+        edge_counts = defaultdict(int)
         for conn in connections:
             from_primary = resolve(conn['from'])
             to_primary = resolve(conn['to'])
@@ -259,8 +348,7 @@ class GraphAnalyzer:
             if from_primary == to_primary:
                 continue  # self-loop after resolution
 
-            key = (from_primary, to_primary)
-            edge_counts[key] = edge_counts.get(key, 0) + 1
+            edge_counts[(from_primary, to_primary)] += 1
 
         resolved = []
         for (f, t), weight in edge_counts.items():
@@ -283,19 +371,20 @@ class GraphAnalyzer:
         Returns:
             Dict[str, int]: {element_id: level_number}
         """
-        # Filtrar contenedores (elementos con 'contains') y elementos sin coordenadas
-        normal_elements = [e for e in elements if 'contains' not in e and 'y' in e]
+        # Filtrar contenedores (elementos con 'contains') y elementos sin coordenadas;
+        # se ordenan pares (y, id) para no releer los dicts en el barrido
+        y_and_ids = [(e['y'], e['id']) for e in elements if 'contains' not in e and 'y' in e]
+        y_and_ids.sort(key=itemgetter(0))
 
-        sorted_by_y = sorted(normal_elements, key=lambda e: e['y'])
         levels = {}
         current_level = 0
         last_y = -100
 
-        for elem in sorted_by_y:
-            if elem['y'] - last_y > 80:  # Nueva fila
+        for y, elem_id in y_and_ids:
+            if y - last_y > 80:  # Nueva fila
                 current_level += 1
-            levels[elem['id']] = current_level
-            last_y = elem['y']
+            levels[elem_id] = current_level
+            last_y = y
 
         return levels
 
@@ -305,7 +394,7 @@ class GraphAnalyzer:
         elements: List[dict]
     ) -> List[List[str]]:
         """
-        Identifica subgrafos conectados usando DFS.
+        Identifica subgrafos conectados usando DFS iterativo.
 
         Args:
             graph: Grafo de adyacencia
@@ -317,19 +406,25 @@ class GraphAnalyzer:
         visited = set()
         groups = []
 
-        def dfs(node, group):
-            if node in visited:
-                return
-            visited.add(node)
-            group.append(node)
-            for neighbor in graph.get(node, []):
-                dfs(neighbor, group)
-
+        # DFS iterativo (sin recursión): los vecinos se apilan en orden
+        # inverso para visitar en el mismo orden que la versión recursiva
         for elem in elements:
-            if elem['id'] not in visited:
-                group = []
-                dfs(elem['id'], group)
-                groups.append(group)
+            start = elem['id']
+            if start in visited:
+                continue
+
+            group = []
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                if node in visited:
+                    continue
+                visited.add(node)
+                group.append(node)
+                neighbors = graph.get(node)
+                if neighbors:
+                    stack.extend(reversed(neighbors))
+            groups.append(group)
 
         return groups
 
@@ -380,18 +475,24 @@ class GraphAnalyzer:
                 priority_value: 0=high, 1=normal, 2=low
         """
         priorities = {}
+        priority_order = self.PRIORITY_ORDER
+        auto_by_degree = self.AUTO_PRIORITY_BY_DEGREE
+        high = priority_order['high']
+        neighbors_of = graph.get
 
         for elem in elements:
             elem_id = elem['id']
 
             # Prioridad manual tiene precedencia
             manual_priority = elem.get('label_priority')
-            if manual_priority in self.PRIORITY_ORDER:
-                priorities[elem_id] = self.PRIORITY_ORDER[manual_priority]
-            else:
-                # Calcular automáticamente
-                auto_priority = self.calculate_auto_priority(elem_id, graph)
-                priorities[elem_id] = self.PRIORITY_ORDER[auto_priority]
+            if manual_priority in priority_order:
+                priorities[elem_id] = priority_order[manual_priority]
+                continue
+
+            # Automática: mismos umbrales que calculate_auto_priority, por tabla
+            neighbors = neighbors_of(elem_id)
+            degree = len(neighbors) if neighbors else 0
+            priorities[elem_id] = auto_by_degree[degree] if degree < 4 else high
 
         return priorities
 
@@ -405,5 +506,4 @@ class GraphAnalyzer:
         Returns:
             str: 'high', 'normal', o 'low'
         """
-        reverse_map = {v: k for k, v in self.PRIORITY_ORDER.items()}
-        return reverse_map.get(priority_value, 'normal')
+        return self.PRIORITY_NAMES.get(priority_value, 'normal')
@@ -15,11 +15,55 @@ Algoritmo:
 from typing import List, Tuple, Dict, Optional
 from dataclasses import dataclass
 import logging
+import math
+import sys
 
-logger = logging.getLogger('AlmaGag.LabelOptimizer')
+from AlmaGag.layout.geometry import SpatialIndex
 
+logger = logging.getLogger('AlmaGag.LabelOptimizer')
 
-@dataclass
+# Label y LabelPosition se crean por miles (8 candidatos por etiqueta):
+# __slots__ evita un __dict__ por instancia. dataclass(slots=True) requiere
+# Python 3.10+; en versiones anteriores quedan como dataclasses normales.
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# Radio (px) de la penalización por densidad local; también lado de celda
+# del índice de centros de etiquetas colocadas
+DENSITY_RADIUS = 75.0
+
+# Máximo que pueden restar las preferencias de posición en score_position
+MAX_SCORE_BONUS = 20
+
+# Posiciones candidatas por categoría: (offset_name, columna x, fila y, anchor).
+# Columna/fila 0 resta el offset, 1 no desplaza y 2 lo suma.
+_CONNECTION_OFFSETS = (
+    ("top", 1, 0, "middle"),
+    ("bottom", 1, 2, "middle"),
+    ("left", 0, 1, "end"),
+    ("right", 2, 1, "start"),
+    ("top-left", 0, 0, "end"),
+    ("top-right", 2, 0, "start"),
+    ("bottom-left", 0, 2, "end"),
+    ("bottom-right", 2, 2, "start"),
+)
+_CONTAINER_OFFSETS = (
+    ("top", 1, 0, "middle"),
+    ("top-left", 0, 0, "end"),
+    ("top-right", 2, 0, "start"),
+)
+_ELEMENT_OFFSETS = (
+    ("bottom", 1, 2, "middle"),  # Preferido
+    ("top", 1, 0, "middle"),
+    ("right", 2, 1, "start"),
+    ("left", 0, 1, "end"),
+    ("bottom-right", 2, 2, "start"),
+    ("bottom-left", 0, 2, "end"),
+    ("top-right", 2, 0, "start"),
+    ("top-left", 0, 0, "end"),
+)
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class Label:
     """
     Representa una etiqueta en el diagrama.
@@ -46,7 +90,7 @@ class Label:
     element_center_y: Optional[float] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class LabelPosition:
     """
     Representa una posición calculada para una etiqueta.
@@ -58,6 +102,8 @@ class LabelPosition:
         anchor: Alineación del texto ('start', 'middle', 'end')
         offset_name: Nombre descriptivo del offset ('top', 'bottom', etc.)
         score: Score de calidad de esta posición (menor = mejor)
+        bbox: Bounding box del texto en esta posición (x1, y1, x2, y2);
+              lo completa score_position la primera vez que la evalúa
     """
     label_id: str
     x: float
@@ -65,6 +111,7 @@ class LabelPosition:
     anchor: str
     offset_name: str
     score: float = 0.0
+    bbox: Optional[Tuple[float, float, float, float]] = None
 
 
 class LabelPositionOptimizer:
@@ -119,8 +166,6 @@ class LabelPositionOptimizer:
         Returns:
             List[LabelPosition]: Lista de posiciones candidatas
         """
-        candidates = []
-
         # Para elementos con centro conocido, usar el centro del ícono
         # como base para candidatos (no la posición pre-calculada de la etiqueta)
         if label.category == "element" and label.element_center_x is not None:
@@ -128,63 +173,39 @@ class LabelPositionOptimizer:
         else:
             x, y = label.anchor_x, label.anchor_y
 
-        # Offsets calculados dinámicamente según el tamaño del elemento
-        # Fórmula: OFFSET = (dimension/2) + (1.5 * char_size)
-        # Esto garantiza ~21px de separación desde el borde del elemento
-        char_height = label.font_size
-        char_width = label.font_size * 0.6  # Aproximación ancho de carácter
-
-        NEAR_OFFSET = (element_height / 2) + (1.5 * char_height)
-        FAR_OFFSET = (element_width / 2) + (1.5 * char_width)
-
-        if label.category == "connection":
-            # 8 posiciones para conexiones
-            offsets = [
-                ("top", x, y - NEAR_OFFSET, "middle"),
-                ("bottom", x, y + NEAR_OFFSET, "middle"),
-                ("left", x - FAR_OFFSET, y, "end"),
-                ("right", x + FAR_OFFSET, y, "start"),
-                ("top-left", x - FAR_OFFSET, y - NEAR_OFFSET, "end"),
-                ("top-right", x + FAR_OFFSET, y - NEAR_OFFSET, "start"),
-                ("bottom-left", x - FAR_OFFSET, y + NEAR_OFFSET, "end"),
-                ("bottom-right", x + FAR_OFFSET, y + NEAR_OFFSET, "start"),
-            ]
-        elif label.category == "container":
-            # 3 posiciones para contenedores (siempre arriba)
-            offsets = [
-                ("top", x, y - 10, "middle"),
-                ("top-left", x - 20, y - 10, "end"),
-                ("top-right", x + 20, y - 10, "start"),
-            ]
-        else:  # element
-            # 8 posiciones para elementos (bottom primero - preferido)
-            offsets = [
-                ("bottom", x, y + NEAR_OFFSET, "middle"),  # Preferido
-                ("top", x, y - NEAR_OFFSET, "middle"),
-                ("right", x + FAR_OFFSET, y, "start"),
-                ("left", x - FAR_OFFSET, y, "end"),
-                ("bottom-right", x + FAR_OFFSET, y + NEAR_OFFSET, "start"),
-                ("bottom-left", x - FAR_OFFSET, y + NEAR_OFFSET, "end"),
-                ("top-right", x + FAR_OFFSET, y - NEAR_OFFSET, "start"),
-                ("top-left", x - FAR_OFFSET, y - NEAR_OFFSET, "end"),
-            ]
-
-        for offset_name, pos_x, pos_y, anchor in offsets:
-            candidates.append(LabelPosition(
-                label_id=label.id,
-                x=pos_x,
-                y=pos_y,
-                anchor=anchor,
-                offset_name=offset_name
-            ))
+        if label.category == "container":
+            # 3 posiciones para contenedores (siempre arriba), desplazamientos fijos
+            table = _CONTAINER_OFFSETS
+            near_offset, far_offset = 10, 20
+        else:
+            # Offsets calculados dinámicamente según el tamaño del elemento
+            # Fórmula: OFFSET = (dimension/2) + (1.5 * char_size)
+            # Esto garantiza ~21px de separación desde el borde del elemento
+            char_height = label.font_size
+            char_width = label.font_size * 0.6  # Aproximación ancho de carácter
+
+            near_offset = (element_height / 2) + (1.5 * char_height)
+            far_offset = (element_width / 2) + (1.5 * char_width)
 
-        return candidates
+            # 8 posiciones; para elementos bottom va primero (preferido)
+            table = _CONNECTION_OFFSETS if label.category == "connection" else _ELEMENT_OFFSETS
+
+        # Columnas/filas de la tabla: 0 = restar offset, 1 = sin desplazar, 2 = sumar
+        xs = (x - far_offset, x, x + far_offset)
+        ys = (y - near_offset, y, y + near_offset)
+
+        label_id = label.id
+        return [
+            LabelPosition(label_id, xs[column], ys[row], anchor, offset_name)
+            for offset_name, column, row, anchor in table
+        ]
 
     def calculate_local_density(
         self,
         position_bbox: Tuple[float, float, float, float],
         placed_labels: List[Tuple[float, float, float, float]],
-        radius: float = 100.0
+        radius: float = 100.0,
+        placed_centers=None
     ) -> int:
         """
         Calcula la densidad local de etiquetas alrededor de una posición.
@@ -196,6 +217,9 @@ class LabelPositionOptimizer:
             position_bbox: Bounding box de la posición candidata (x1, y1, x2, y2)
             placed_labels: Lista de bboxes de etiquetas ya colocadas
             radius: Radio de búsqueda en píxeles (default: 100px)
+            placed_centers: SpatialIndex con los centros (x, y, x, y) de
+                placed_labels (opcional); si se pasa, solo se miden las
+                etiquetas de las celdas cercanas
 
         Returns:
             int: Número de etiquetas dentro del radio
@@ -205,17 +229,31 @@ class LabelPositionOptimizer:
         center_x = (x1 + x2) / 2
         center_y = (y1 + y2) / 2
 
-        count = 0
-        for label_bbox in placed_labels:
-            # Centro de la etiqueta ya colocada
-            lx1, ly1, lx2, ly2 = label_bbox
-            label_center_x = (lx1 + lx2) / 2
-            label_center_y = (ly1 + ly2) / 2
+        if placed_centers is not None:
+            # Caja del radio con 1px de holgura: solo descarta centros lejanos,
+            # la prueba de distancia es la misma que en el escaneo lineal
+            reach = radius + 1
+            nearby = placed_centers.candidates(
+                (center_x - reach, center_y - reach, center_x + reach, center_y + reach)
+            )
+            centers = ((label_x, label_y) for label_x, label_y, _, _ in nearby)
+        else:
+            # Centro de cada etiqueta ya colocada
+            centers = (((lx1 + lx2) / 2, (ly1 + ly2) / 2) for lx1, ly1, lx2, ly2 in placed_labels)
 
-            # Distancia entre centros
-            distance = ((center_x - label_center_x)**2 + (center_y - label_center_y)**2)**0.5
+        # Distancia entre centros comparada al cuadrado; la raíz solo se calcula
+        # en la franja de redondeo alrededor de radius² (mismo resultado que
+        # comparar sqrt(d²) <= radius)
+        radius_sq = radius * radius
+        accept_below = radius_sq * (1 - 1e-12)
+        reject_above = radius_sq * (1 + 1e-12)
 
-            if distance <= radius:
+        count = 0
+        for label_center_x, label_center_y in centers:
+            distance_sq = (center_x - label_center_x)**2 + (center_y - label_center_y)**2
+            if distance_sq < accept_below or (
+                distance_sq <= reject_above and distance_sq**0.5 <= radius
+            ):
                 count += 1
 
         return count
@@ -226,7 +264,11 @@ class LabelPositionOptimizer:
         label: Label,
         elements: List[dict],
         placed_labels: List[Tuple[float, float, float, float]],
-        connections: List[dict] = None
+        connections: List[dict] = None,
+        element_index=None,
+        placed_centers=None,
+        cutoff: float = None,
+        connection_lines: List[Tuple[dict, Tuple[float, float, float, float]]] = None
     ) -> float:
         """
         Evalúa la calidad de una posición para una etiqueta.
@@ -248,20 +290,39 @@ class LabelPositionOptimizer:
             elements: Lista de elementos del diagrama
             placed_labels: Lista de bboxes de etiquetas ya colocadas
             connections: Lista de conexiones con endpoints (opcional, v3.2)
+            element_index: SpatialIndex de los elementos (opcional, ver
+                GeometryCalculator.build_spatial_index)
+            placed_centers: SpatialIndex de centros de placed_labels (opcional,
+                ver calculate_local_density)
+            cutoff: Mejor score conocido (opcional); si las penalizaciones ya
+                acumuladas garantizan no mejorarlo, se corta la evaluación
+            connection_lines: Resultado de _connection_lines(elements, connections)
+                (opcional, evita recalcular los endpoints en cada candidato)
 
         Returns:
-            float: Score de la posición (menor es mejor)
+            float: Score de la posición (menor es mejor), o infinito si se
+                cortó por cutoff
         """
         score = 0.0
 
-        # Calcular bbox de la etiqueta en esta posición
-        label_bbox = self.geometry.get_text_bbox(
-            position.x,
-            position.y,
-            label.text,
-            label.font_size,
-            position.anchor
-        )
+        # Las penalizaciones nunca restan y las preferencias restan como mucho
+        # MAX_SCORE_BONUS: por encima de este umbral el candidato ya no gana
+        # (1px de holgura frente al redondeo de las sumas)
+        if cutoff is None:
+            stop_above = math.inf
+        else:
+            stop_above = cutoff + MAX_SCORE_BONUS + 1
+
+        # Calcular bbox de la etiqueta en esta posición (una vez por candidato)
+        label_bbox = position.bbox
+        if label_bbox is None:
+            label_bbox = position.bbox = self.geometry.get_text_bbox(
+                position.x,
+                position.y,
+                label.text,
+                label.font_size,
+                position.anchor
+            )
 
         # Verificar si está fuera del canvas
         x1, y1, x2, y2 = label_bbox
@@ -269,46 +330,44 @@ class LabelPositionOptimizer:
             score += 1000  # Penalización severa
 
         # Colisiones con elementos
-        if self.geometry.label_intersects_elements(label_bbox, elements):
+        if self.geometry.label_intersects_elements(label_bbox, elements, element_index):
             score += 100
 
         # Colisiones con otras etiquetas
         if self.geometry.label_intersects_labels(label_bbox, placed_labels):
             score += 50
 
+        if score > stop_above:
+            return math.inf
+
         # Colisiones con líneas de conexión (v3.2)
         if connections:
-            # Crear lookup de elementos por ID
-            elements_by_id = {elem.get('id'): elem for elem in elements if elem.get('id')}
-
-            for conn in connections:
-                # Obtener endpoints de la conexión
-                from_elem = elements_by_id.get(conn.get('from'))
-                to_elem = elements_by_id.get(conn.get('to'))
-
-                if from_elem and to_elem:
-                    # Calcular centro de cada elemento
-                    from_x = from_elem.get('x', 0) + from_elem.get('width', 80) / 2
-                    from_y = from_elem.get('y', 0) + from_elem.get('height', 50) / 2
-                    to_x = to_elem.get('x', 0) + to_elem.get('width', 80) / 2
-                    to_y = to_elem.get('y', 0) + to_elem.get('height', 50) / 2
-
-                    line_endpoints = (from_x, from_y, to_x, to_y)
-
-                    # Verificar si la línea cruza el bbox de la etiqueta
-                    if self.geometry.line_intersects_rect(line_endpoints, label_bbox):
-                        score += 75
-                        if self.debug:
-                            logger.debug(f"    Colisión con línea {conn.get('from')}->{conn.get('to')} (+75)")
+            if connection_lines is None:
+                connection_lines = self._connection_lines(elements, connections)
+
+            line_intersects_rect = self.geometry.line_intersects_rect
+            for conn, line_endpoints in connection_lines:
+                # Verificar si la línea cruza el bbox de la etiqueta
+                if line_intersects_rect(line_endpoints, label_bbox):
+                    score += 75
+                    if self.debug:
+                        logger.debug(f"    Colisión con línea {conn.get('from')}->{conn.get('to')} (+75)")
+                    if score > stop_above:
+                        return math.inf
 
         # Distancia al anchor (preferir cerca)
         distance = ((position.x - label.anchor_x)**2 + (position.y - label.anchor_y)**2)**0.5
         score += distance / 10
 
+        if score > stop_above:
+            return math.inf
+
         # Penalización por densidad local (evitar clustering) - v3.1
         # Configuración optimizada: radius=75px, penalty=60
         # Balance entre detección efectiva y no sobre-penalizar
-        density = self.calculate_local_density(label_bbox, placed_labels, radius=75.0)
+        density = self.calculate_local_density(
+            label_bbox, placed_labels, radius=DENSITY_RADIUS, placed_centers=placed_centers
+        )
         density_penalty = density * 60
         score += density_penalty
         if self.debug and density > 0:
@@ -334,6 +393,50 @@ class LabelPositionOptimizer:
 
         return score
 
+    @staticmethod
+    def _connection_lines(
+        elements: List[dict],
+        connections: List[dict]
+    ) -> List[Tuple[dict, Tuple[float, float, float, float]]]:
+        """
+        Calcula los endpoints (centro a centro) de cada conexión entre elementos.
+
+        Args:
+            elements: Lista de elementos del diagrama
+            connections: Lista de conexiones
+
+        Returns:
+            List[Tuple]: (conn, (from_x, from_y, to_x, to_y)) en orden de connections
+        """
+        # Crear lookup de elementos por ID
+        elements_by_id = {elem.get('id'): elem for elem in elements if elem.get('id')}
+
+        lines = []
+        for conn in connections:
+            # Obtener endpoints de la conexión
+            from_elem = elements_by_id.get(conn.get('from'))
+            to_elem = elements_by_id.get(conn.get('to'))
+
+            if from_elem and to_elem:
+                # Calcular centro de cada elemento
+                from_x = from_elem.get('x', 0) + from_elem.get('width', 80) / 2
+                from_y = from_elem.get('y', 0) + from_elem.get('height', 50) / 2
+                to_x = to_elem.get('x', 0) + to_elem.get('width', 80) / 2
+                to_y = to_elem.get('y', 0) + to_elem.get('height', 50) / 2
+
+                lines.append((conn, (from_x, from_y, to_x, to_y)))
+        return lines
+
+    @staticmethod
+    def _index_center(placed_centers: SpatialIndex, bbox: Tuple[float, float, float, float]) -> None:
+        """
+        Registra el centro de una etiqueta colocada como punto (x, y, x, y).
+        """
+        x1, y1, x2, y2 = bbox
+        center_x = (x1 + x2) / 2
+        center_y = (y1 + y2) / 2
+        placed_centers.insert((center_x, center_y, center_x, center_y))
+
     def optimize_labels(
         self,
         labels: List[Label],
@@ -378,8 +481,14 @@ class LabelPositionOptimizer:
         # Resultado
         best_positions = {}
 
-        # Etiquetas ya colocadas (bboxes)
+        # Los elementos no se mueven durante la optimización: indexarlos una vez,
+        # junto con las líneas de conexión entre sus centros
+        element_index = self.geometry.build_spatial_index(elements)
+        connection_lines = self._connection_lines(elements, connections) if connections else None
+
+        # Etiquetas ya colocadas (bboxes) y sus centros indexados para densidad
         placed_bboxes = []
+        placed_centers = SpatialIndex(DENSITY_RADIUS)
 
         # Procesar etiquetas fijas primero
         for label in fixed_labels:
@@ -402,6 +511,7 @@ class LabelPositionOptimizer:
                 fixed_pos.anchor
             )
             placed_bboxes.append(bbox)
+            self._index_center(placed_centers, bbox)
 
         # Optimizar etiquetas movibles
         for idx, label in enumerate(optimizable, 1):
@@ -428,7 +538,13 @@ class LabelPositionOptimizer:
             best_position = None
 
             for candidate in candidates:
-                score = self.score_position(candidate, label, elements, placed_bboxes, connections)
+                # En modo debug se evalúan completos para registrar cada score
+                score = self.score_position(
+                    candidate, label, elements, placed_bboxes, connections,
+                    element_index, placed_centers,
+                    cutoff=None if self.debug else best_score,
+                    connection_lines=connection_lines
+                )
                 candidate.score = score
 
                 if self.debug:
@@ -447,15 +563,10 @@ class LabelPositionOptimizer:
 
                 best_positions[label.id] = best_position
 
-                # Agregar a placed_bboxes
-                bbox = self.geometry.get_text_bbox(
-                    best_position.x,
-                    best_position.y,
-                    label.text,
-                    label.font_size,
-                    best_position.anchor
-                )
+                # Agregar a placed_bboxes (bbox ya calculado en score_position)
+                bbox = best_position.bbox
                 placed_bboxes.append(bbox)
+                self._index_center(placed_centers, bbox)
 
         if self.debug:
             high_scores = sum(1 for pos in best_positions.values() if pos.score > 50)
@@ -10,6 +10,7 @@ Date: 2026-01-17
 """
 
 import logging
+from collections import deque
 from dataclasses import dataclass, field
 from typing import Dict, List, Tuple, Optional, Set
 from AlmaGag.utils import extract_item_id
@@ -1400,7 +1401,7 @@ class StructureAnalyzer:
 
         # Calcular niveles usando BFS sobre DAG contraído
         visited = set()
-        queue = []
+        queue = deque()
 
         # Encontrar elementos sin dependencias entrantes (nivel 0)
         has_incoming = set()
@@ -1416,7 +1417,7 @@ class StructureAnalyzer:
 
         # BFS
         while queue:
-            current_id, level = queue.pop(0)
+            current_id, level = queue.popleft()
             contracted_levels[current_id] = level
 
             # Procesar vecinos
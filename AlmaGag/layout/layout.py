@@ -14,8 +14,9 @@ Filosofía:
 """
 
 from copy import deepcopy
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
 from dataclasses import dataclass, field
+from AlmaGag.utils import extract_item_id
 
 
 @dataclass
@@ -36,6 +37,14 @@ class Layout:
         groups (List): Subgrafos conectados [[elem_ids_grupo_1], ...]
         priorities (Dict): Prioridades de elementos {element_id: priority_value}
 
+        elements_by_id (Dict): Lookup de elementos {element_id: element}
+        element_to_container (Dict): Índice inverso de contención {child_id: container_id};
+            si un ID figura en varios 'contains', guarda el último contenedor
+        container_parents (Dict): Todos los contenedores que listan cada ID
+            {child_id: {container_ids}}
+        container_ids (Set): IDs de elementos contenedores (con 'contains')
+        container_children (Dict): IDs contenidos normalizados {container_id: [child_ids]}
+
         _collision_count (Optional[int]): Número de colisiones detectadas
         _collision_pairs (Optional[List]): Lista de pares en colisión
     """
@@ -57,6 +66,10 @@ class Layout:
 
     # Lookup rápido
     elements_by_id: Dict[str, dict] = field(default_factory=dict)
+    element_to_container: Dict[str, str] = field(default_factory=dict)
+    container_parents: Dict[str, Set[str]] = field(default_factory=dict)
+    container_ids: Set[str] = field(default_factory=set)
+    container_children: Dict[str, List[str]] = field(default_factory=dict)
 
     # Métricas de colisiones (lazy evaluation)
     _collision_count: Optional[int] = field(default=None, repr=False)
@@ -66,6 +79,46 @@ class Layout:
         """Construye índices después de inicialización."""
         if not self.elements_by_id:
             self.elements_by_id = {e['id']: e for e in self.elements}
+        self.rebuild_containment_index()
+
+    def rebuild_containment_index(self):
+        """
+        Reconstruye los índices de contención (contenedores e hijo → contenedor).
+
+        Debe llamarse después de cualquier operación que agregue contenedores
+        o modifique las listas 'contains' de los elementos.
+        """
+        # Las refs de 'contains' pueden ser string o dict con 'id'; se
+        # normalizan una sola vez aquí para no repetir el despacho por tipo
+        self.container_children = {
+            elem['id']: [extract_item_id(ref) for ref in elem['contains']]
+            for elem in self.elements
+            if 'contains' in elem
+        }
+        self.container_ids = set(self.container_children)
+        self.element_to_container = {}
+        self.container_parents = {}
+        for container_id, child_ids in self.container_children.items():
+            for child_id in child_ids:
+                self.element_to_container[child_id] = container_id
+                self.container_parents.setdefault(child_id, set()).add(container_id)
+
+    @property
+    def normal_elements(self) -> List[dict]:
+        """
+        Elementos que participan en colisiones, en el orden de elements.
+
+        Incluye los no contenedores y los contenedores ya marcados con
+        '_is_container_calculated'. Se calcula en cada acceso, así que
+        refleja siempre el estado actual sin invalidación manual.
+
+        Returns:
+            List[dict]: Elementos normales
+        """
+        return [
+            elem for elem in self.elements
+            if 'contains' not in elem or elem.get('_is_container_calculated', False)
+        ]
 
     def copy(self) -> 'Layout':
         """
@@ -4,8 +4,13 @@ AlmaGag.utils
 Funciones utilitarias compartidas por múltiples módulos del sistema.
 """
 
+from functools import lru_cache
+
 from AlmaGag.config import TEXT_CHAR_WIDTH, TEXT_LINE_HEIGHT
 
+# Máximo de textos distintos cuyas métricas se recuerdan (LRU)
+LABEL_LINE_METRICS_CACHE_SIZE = 1024
+
 
 def extract_item_id(item):
     """
@@ -24,6 +29,25 @@ def extract_item_id(item):
     return item['id'] if isinstance(item, dict) else item
 
 
+@lru_cache(maxsize=LABEL_LINE_METRICS_CACHE_SIZE)
+def label_line_metrics(label):
+    """
+    Retorna el número de líneas y la longitud de la línea más larga de un texto.
+
+    El resultado se memoriza por el propio texto en un caché LRU acotado:
+    no depende de ningún elemento ni layout, así que nunca queda
+    desactualizado y no crece sin límite en procesos de larga duración.
+
+    Args:
+        label: Texto del label (puede contener '\\n')
+
+    Returns:
+        tuple: (num_lines, max_line_len)
+    """
+    lines = label.split('\n')
+    return (len(lines), max(len(line) for line in lines))
+
+
 def calculate_label_dimensions(label):
     """
     Calcula las dimensiones aproximadas de un label multilinea.
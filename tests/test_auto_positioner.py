@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+test_auto_positioner.py - Tests del AutoLayoutPositioner
+
+Verifica que las rutas aceleradas del posicionador produzcan las mismas
+posiciones que las rutas simples.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import AlmaGag.layout.auto_positioner as auto_positioner
+from AlmaGag.layout.auto_positioner import AutoLayoutPositioner
+from AlmaGag.layout.graph_analysis import GraphAnalyzer
+from AlmaGag.layout.layout import Layout
+from AlmaGag.layout.sizing import SizingCalculator
+
+
+def _random_layout(seed, n_containers=40, n_free=60):
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n_containers):
+        elements.append({
+            'id': f'c{i}',
+            'contains': [],
+            '_resolved': True,
+            'x': rng.uniform(0, 2000),
+            'y': rng.uniform(0, 2000),
+            'width': rng.uniform(80, 400),
+            'height': rng.uniform(50, 300),
+        })
+    for i in range(n_free):
+        elements.append({
+            'id': f'e{i}',
+            'x': rng.uniform(0, 2000),
+            'y': rng.uniform(0, 2000),
+        })
+    return Layout(elements=elements, connections=[], canvas={'width': 2400, 'height': 2400})
+
+
+def test_container_grid_matches_linear_scan(monkeypatch):
+    """El ajuste post-expansión con grid espacial equivale al escaneo lineal."""
+    positioner = AutoLayoutPositioner(SizingCalculator(), GraphAnalyzer())
+
+    for seed in range(10):
+        linear = _random_layout(seed)
+        gridded = _random_layout(seed)
+
+        monkeypatch.setattr(auto_positioner, '_CONTAINER_GRID_MIN', 10 ** 9)
+        positioner.recalculate_positions_with_expanded_containers(linear)
+        monkeypatch.setattr(auto_positioner, '_CONTAINER_GRID_MIN', 1)
+        positioner.recalculate_positions_with_expanded_containers(gridded)
+
+        assert [e['y'] for e in linear.elements] == [e['y'] for e in gridded.elements]
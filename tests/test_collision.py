@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+test_collision.py - Tests del CollisionDetector
+
+Verifica que la detección acelerada de pares coincida con la comparación
+exhaustiva por pares usando GeometryCalculator.rectangles_intersect, que
+las consultas por elemento con geometría compartida den los mismos conteos,
+y que el índice espacial de etiquetas coincida con el escaneo lineal.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from AlmaGag.layout.collision import CollisionDetector
+from AlmaGag.layout.geometry import GeometryCalculator
+from AlmaGag.layout.layout import Layout
+from AlmaGag.layout.sizing import SizingCalculator
+
+
+def _random_bboxes(rng, n):
+    bboxes = []
+    for i in range(n):
+        if rng.random() < 0.05:
+            bboxes.append((None, 'icon', f'e{i}'))
+            continue
+        x = rng.choice([rng.uniform(0, 1000), float(rng.randrange(0, 1000, 50))])
+        y = rng.choice([rng.uniform(0, 1000), float(rng.randrange(0, 1000, 50))])
+        w = rng.choice([rng.uniform(0, 120), 50.0])
+        h = rng.choice([rng.uniform(0, 120), 50.0])
+        bboxes.append(((x, y, x + w, y + h), 'icon', f'e{i}'))
+    return bboxes
+
+
+def test_intersecting_pairs_matches_brute_force():
+    """El sweep-line encuentra exactamente los pares de la búsqueda O(N²)."""
+    geometry = GeometryCalculator(SizingCalculator())
+    detector = CollisionDetector(geometry)
+    rng = random.Random(42)
+
+    for n in (0, 1, 2, 10, 80, 200):
+        bboxes = _random_bboxes(rng, n)
+        expected = [
+            (i, j)
+            for i in range(n)
+            for j in range(i + 1, n)
+            if geometry.rectangles_intersect(bboxes[i][0], bboxes[j][0])
+        ]
+        assert detector._intersecting_pairs(bboxes) == expected
+
+
+def test_count_element_collisions_with_shared_queries():
+    """Compartir ElementQueryCache mientras cambian etiquetas no altera los conteos."""
+    geometry = GeometryCalculator(SizingCalculator())
+    detector = CollisionDetector(geometry)
+    rng = random.Random(7)
+
+    elements = [
+        {'id': f'e{i}', 'x': rng.uniform(0, 500), 'y': rng.uniform(0, 500), 'label': 'etiqueta'}
+        for i in range(25)
+    ]
+    connections = [
+        {'from': f'e{rng.randrange(25)}', 'to': f'e{rng.randrange(25)}'}
+        for _ in range(30)
+    ]
+    layout = Layout(elements=elements, connections=connections, canvas={'width': 800, 'height': 800})
+    for elem in elements:
+        layout.label_positions[elem['id']] = geometry.get_text_coords(elem, 'bottom')
+
+    queries = detector.prepare_element_queries(layout)
+    for elem in elements:
+        for position in ('top', 'left', 'right', 'bottom'):
+            layout.label_positions[elem['id']] = geometry.get_text_coords(elem, position)
+            assert (
+                detector.count_element_collisions(layout, elem['id'], queries)
+                == detector.count_element_collisions(layout, elem['id'])
+            )
+
+
+def test_spatial_index_matches_linear_label_scan():
+    """label_intersects_elements con SpatialIndex equivale al escaneo lineal."""
+    geometry = GeometryCalculator(SizingCalculator())
+    rng = random.Random(3)
+
+    elements = [
+        {'id': f'e{i}', 'x': rng.uniform(-300, 1500), 'y': rng.uniform(-300, 1500)}
+        for i in range(120)
+    ]
+    elements.append({'id': 'sin_coordenadas'})
+    index = geometry.build_spatial_index(elements, cell_size=150)
+
+    for _ in range(500):
+        x = float(rng.randrange(-400, 1600, 10))
+        y = float(rng.randrange(-400, 1600, 10))
+        label_bbox = (x, y, x + rng.uniform(0, 300), y + rng.uniform(0, 40))
+        assert (
+            geometry.label_intersects_elements(label_bbox, elements, index)
+            == geometry.label_intersects_elements(label_bbox, elements)
+        )
+
+
+def test_child_listed_in_two_containers_is_exempt_from_both():
+    """Un hijo listado en dos 'contains' no colisiona con ninguno de ellos."""
+    detector = CollisionDetector(GeometryCalculator(SizingCalculator()))
+    layout = Layout(
+        elements=[
+            {'id': 'c1', 'contains': ['shared'], 'x': 0, 'y': 0,
+             'width': 300, 'height': 200, '_is_container_calculated': True},
+            {'id': 'c2', 'contains': [{'id': 'shared'}], 'x': 500, 'y': 0,
+             'width': 300, 'height': 200, '_is_container_calculated': True},
+            {'id': 'shared', 'x': 280, 'y': 50},
+        ],
+        connections=[],
+        canvas={'width': 1000, 'height': 600},
+    )
+
+    count, pairs = detector.detect_all_collisions(layout)
+
+    # El ícono de 'shared' (280..360) toca ambos contenedores
+    assert all('shared' not in (id1, id2) for id1, id2, _ in pairs), pairs
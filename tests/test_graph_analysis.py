@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+test_graph_analysis.py - Tests del GraphAnalyzer
+
+Verifica niveles topológicos (DAG, ciclos, self-loops y extremos ajenos
+a elements), el orden de iteración del resultado, los conteos de
+descendientes por raíz, los scores de centralidad, los grupos conexos y la
+resolución de conexiones a elementos primarios.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from AlmaGag.layout.graph_analysis import GraphAnalyzer
+
+
+def _elements(*ids):
+    return [{'id': elem_id} for elem_id in ids]
+
+
+def _connections(*pairs):
+    return [{'from': from_id, 'to': to_id} for from_id, to_id in pairs]
+
+
+def test_topological_levels_dag():
+    """DAG: longest-path desde la raíz más corrección de hojas."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('A', 'B', 'C', 'D', 'E'),
+        _connections(('A', 'B'), ('B', 'C'), ('B', 'D'), ('C', 'E'))
+    )
+
+    # D es hoja con hermano no-hoja (C): queda al nivel de su padre.
+    # E es hoja terminal: sube un nivel sobre su padre.
+    assert levels == {'A': 0, 'B': 1, 'C': 2, 'D': 1, 'E': 3}
+
+
+def test_topological_levels_cycle_terminates():
+    """Ciclos: la pasada iterativa acotada termina y respeta las hojas."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('R1', 'R2', 'A', 'B', 'L'),
+        _connections(('R1', 'A'), ('A', 'B'), ('B', 'A'), ('R2', 'B'), ('B', 'L'))
+    )
+
+    assert set(levels) == {'R1', 'R2', 'A', 'B', 'L'}
+    # Raíces con el mismo número de descendientes (A, B, L) se quedan en 0
+    assert levels['R1'] == 0
+    assert levels['R2'] == 0
+    # Los nodos del ciclo crecen hasta el tope de N rondas
+    assert levels['A'] > 0 and levels['B'] > 0
+    # L es hoja con hermano no-hoja (A): se alinea con su padre
+    assert levels['L'] == levels['B']
+
+
+def test_topological_levels_self_loop_ignored():
+    """Un self-loop no crea niveles ni convierte al grafo en cíclico."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('A', 'B', 'C'),
+        _connections(('A', 'A'), ('A', 'B'), ('B', 'C'))
+    )
+
+    assert levels == {'A': 0, 'B': 1, 'C': 2}
+
+
+def test_topological_levels_ignore_unknown_endpoints():
+    """Conexiones con extremos que no están en elements se ignoran."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('A', 'B', 'C'),
+        _connections(('A', 'B'), ('B', 'Z'), ('Y', 'C'), ('B', 'C'))
+    )
+
+    assert levels == {'A': 0, 'B': 1, 'C': 2}
+
+
+def test_topological_levels_iteration_order():
+    """El resultado se itera en el orden del conjunto de ids de elements."""
+    elements = _elements('n3', 'n1', 'n4', 'n0', 'n2')
+    levels = GraphAnalyzer().calculate_topological_levels(
+        elements,
+        _connections(('n0', 'n1'), ('n1', 'n2'), ('n3', 'n4'))
+    )
+
+    assert list(levels) == list({e['id'] for e in elements})
+
+
+def test_root_descendants_count_diamond_once():
+    """Un diamante cuenta cada descendiente una vez al comparar raíces."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('R1', 'A', 'B', 'D', 'R2', 'X', 'Y'),
+        _connections(
+            ('R1', 'A'), ('R1', 'B'), ('A', 'D'), ('B', 'D'),
+            ('R2', 'D'), ('R2', 'X'), ('X', 'Y')
+        )
+    )
+
+    # R1 y R2 tienen 3 descendientes cada una: ninguna se reubica.
+    # Contar D dos veces (A->D, B->D) movería R2 al nivel de A/B.
+    assert levels == {'R1': 0, 'A': 1, 'B': 1, 'D': 1, 'R2': 0, 'X': 1, 'Y': 2}
+
+
+def test_minor_source_moves_to_co_parent_level():
+    """La raíz con menos descendientes pasa al nivel del otro padre."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('R1', 'R2', 'A', 'D'),
+        _connections(('R1', 'A'), ('A', 'D'), ('R2', 'D'))
+    )
+
+    assert levels == {'R1': 0, 'R2': 1, 'A': 1, 'D': 2}
+
+
+def test_centrality_scores_diamond():
+    """Diamante: fan-out en la raíz y fan-in en el sumidero."""
+    analyzer = GraphAnalyzer()
+    elements = _elements('A', 'B', 'C', 'D')
+    connections = _connections(('A', 'B'), ('A', 'C'), ('B', 'D'), ('C', 'D'))
+    levels = analyzer.calculate_topological_levels(elements, connections)
+
+    scores = analyzer.calculate_centrality_scores(elements, connections, levels)
+
+    assert scores == {'A': 0.10, 'B': 0.0, 'C': 0.0, 'D': 0.15}
+    # Reutilizar el grafo direccional da el mismo resultado
+    directed = analyzer.build_directed_graph(elements, connections)
+    assert analyzer.calculate_centrality_scores(
+        elements, connections, levels, directed
+    ) == scores
+
+
+def test_centrality_scores_cycle():
+    """Ciclo: cada arista cuenta una vez; extremos ajenos se ignoran."""
+    analyzer = GraphAnalyzer()
+    elements = _elements('A', 'B', 'C')
+    connections = _connections(
+        ('A', 'B'), ('B', 'C'), ('C', 'A'), ('C', 'B'), ('C', 'Z')
+    )
+
+    scores = analyzer.calculate_centrality_scores(elements, connections, {})
+
+    assert scores == {'A': 0.0, 'B': 0.15, 'C': 0.10}
+    assert list(scores) == ['A', 'B', 'C']
+
+
+def test_identify_groups_order_and_membership():
+    """Grupos en orden de elements; cada grupo en orden DFS de vecinos."""
+    analyzer = GraphAnalyzer()
+    elements = _elements('A', 'B', 'C', 'D', 'E', 'F', 'G')
+    connections = _connections(
+        ('A', 'B'), ('A', 'C'), ('B', 'D'), ('E', 'A'), ('F', 'F'), ('G', 'Z')
+    )
+
+    groups = analyzer.identify_groups(
+        analyzer.build_graph(elements, connections), elements
+    )
+
+    # DFS (no BFS): B se explora hasta D antes de volver a C.
+    # Z no está en elements pero figura como vecino de G, así que se agrupa
+    assert groups == [['A', 'B', 'D', 'C', 'E'], ['F'], ['G', 'Z']]
+
+
+def test_resolve_connections_to_primary_nested_containers():
+    """Hijos anidados suben hasta su primario; refs string o {'id': ...}."""
+    elements = [
+        {'id': 'outer', 'contains': [{'id': 'inner'}]},
+        {'id': 'inner', 'contains': ['leaf1', {'id': 'leaf2', 'scope': 'local'}]},
+        {'id': 'leaf1'},
+        {'id': 'leaf2'},
+        {'id': 'P'},
+    ]
+    connections = _connections(
+        ('leaf1', 'P'), ('leaf2', 'P'), ('P', 'inner'), ('P', 'leaf2')
+    )
+
+    resolved = GraphAnalyzer().resolve_connections_to_primary(
+        elements, {'outer', 'P'}, connections
+    )
+
+    # Duplicados tras resolver se agregan como peso, en orden de aparición
+    assert resolved == [
+        {'from': 'outer', 'to': 'P', 'weight': 2},
+        {'from': 'P', 'to': 'outer', 'weight': 2},
+    ]
+
+
+def test_resolve_connections_to_primary_drops_unresolvable():
+    """Se descartan self-connections, ciclos de contención y huérfanos."""
+    elements = [
+        {'id': 'outer', 'contains': ['leaf1', 'leaf2']},
+        {'id': 'leaf1'},
+        {'id': 'leaf2'},
+        {'id': 'c1', 'contains': ['c2']},
+        {'id': 'c2', 'contains': [{'id': 'c1'}]},
+        {'id': 'P'},
+    ]
+    connections = _connections(
+        ('leaf1', 'leaf2'),  # ambos resuelven a outer
+        ('P', 'P'),
+        ('c1', 'P'),         # c1 <-> c2 nunca llega a un primario
+        ('P', 'c2'),
+        ('X', 'P'),          # X no es primario ni está contenido
+        ('leaf1', 'P'),
+    )
+
+    resolved = GraphAnalyzer().resolve_connections_to_primary(
+        elements, {'outer', 'P'}, connections
+    )
+
+    assert resolved == [{'from': 'outer', 'to': 'P', 'weight': 1}]
+
+
+def test_terminal_leaves_share_parent_check():
+    """Hojas del mismo padre comparten la verificación de hoja terminal."""
+    levels = GraphAnalyzer().calculate_topological_levels(
+        _elements('P', 'L1', 'L2', 'L3', 'Q', 'L4', 'R', 'S', 'M'),
+        _connections(
+            ('P', 'L1'), ('P', 'L2'), ('P', 'L3'),
+            ('Q', 'L4'), ('Q', 'R'), ('R', 'S'),
+            ('P', 'M'), ('Q', 'M')
+        )
+    )
+
+    # Hijos de P son todos hojas: L1..L3 son terminales y suben un nivel.
+    # M también tiene a Q como padre, con un hermano activo (R): no terminal.
+    assert levels == {
+        'P': 0, 'L1': 1, 'L2': 1, 'L3': 1,
+        'Q': 0, 'L4': 0, 'R': 1, 'S': 2, 'M': 0,
+    }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+test_label_optimizer.py - Tests del LabelPositionOptimizer
+
+Verifica que las rutas aceleradas del optimizador de etiquetas den los
+mismos resultados que las evaluaciones completas.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from AlmaGag.layout.geometry import GeometryCalculator, SpatialIndex
+from AlmaGag.layout.label_optimizer import DENSITY_RADIUS, Label, LabelPositionOptimizer
+from AlmaGag.layout.sizing import SizingCalculator
+
+
+def test_local_density_with_center_index_matches_linear_scan():
+    """La densidad con índice de centros equivale a recorrer todas las etiquetas."""
+    optimizer = LabelPositionOptimizer(GeometryCalculator(SizingCalculator()), 1000, 1000)
+    rng = random.Random(11)
+
+    placed = []
+    centers = SpatialIndex(DENSITY_RADIUS)
+    for _ in range(300):
+        x = float(rng.randrange(-100, 1100, 5))
+        y = float(rng.randrange(-100, 1100, 5))
+        bbox = (x, y, x + rng.choice([40.0, rng.uniform(0, 120)]), y + 14.4)
+        placed.append(bbox)
+        optimizer._index_center(centers, bbox)
+
+    for _ in range(500):
+        x = float(rng.randrange(-100, 1100, 5))
+        y = float(rng.randrange(-100, 1100, 5))
+        bbox = (x, y, x + rng.uniform(0, 120), y + 14.4)
+        for radius in (DENSITY_RADIUS, 100.0):
+            assert (
+                optimizer.calculate_local_density(bbox, placed, radius, centers)
+                == optimizer.calculate_local_density(bbox, placed, radius)
+            )
+
+
+def _random_labels(rng, elements):
+    labels = []
+    for i, elem in enumerate(elements):
+        labels.append(Label(
+            id=elem['id'],
+            text='etiqueta\nlarga' if i % 3 == 0 else 'nodo',
+            anchor_x=elem['x'] + 40,
+            anchor_y=elem['y'] + 50,
+            priority=rng.randrange(3),
+            category='element',
+            element_center_x=elem['x'] + 40,
+            element_center_y=elem['y'] + 25,
+        ))
+    for j in range(10):
+        labels.append(Label(
+            id=f'conn{j}',
+            text='conexión',
+            anchor_x=rng.uniform(0, 600),
+            anchor_y=rng.uniform(0, 600),
+            category='connection',
+        ))
+    return labels
+
+
+class _NoCutoffOptimizer(LabelPositionOptimizer):
+    def score_position(self, *args, cutoff=None, **kwargs):
+        return super().score_position(*args, **kwargs)
+
+
+def test_optimize_labels_cutoff_keeps_best_positions():
+    """Cortar candidatos por cutoff no cambia la posición elegida."""
+    geometry = GeometryCalculator(SizingCalculator())
+    rng = random.Random(5)
+
+    for _ in range(5):
+        elements = [
+            {'id': f'e{i}', 'x': rng.uniform(0, 600), 'y': rng.uniform(0, 600)}
+            for i in range(40)
+        ]
+        connections = [
+            {'from': f'e{rng.randrange(40)}', 'to': f'e{rng.randrange(40)}'}
+            for _ in range(30)
+        ]
+        fast = LabelPositionOptimizer(geometry, 700, 700).optimize_labels(
+            _random_labels(random.Random(1), elements), elements, connections
+        )
+        full = _NoCutoffOptimizer(geometry, 700, 700).optimize_labels(
+            _random_labels(random.Random(1), elements), elements, connections
+        )
+        assert {k: (p.x, p.y, p.anchor) for k, p in fast.items()} == \
+            {k: (p.x, p.y, p.anchor) for k, p in full.items()}
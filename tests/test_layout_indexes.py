@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+test_layout_indexes.py - Tests de los índices precalculados del Layout
+
+Verifica que los índices construidos en Layout.__post_init__ reflejen
+la estructura de contención de los elementos.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from AlmaGag.layout.layout import Layout
+
+
+def _make_layout():
+    return Layout(
+        elements=[
+            {'id': 'outer', 'contains': ['inner', {'id': 'a', 'scope': 'border'}]},
+            {'id': 'inner', 'contains': ['b']},
+            {'id': 'a'},
+            {'id': 'b'},
+            {'id': 'free'},
+        ],
+        connections=[],
+        canvas={'width': 800, 'height': 600},
+    )
+
+
+def test_element_to_container_built_on_init():
+    """El índice inverso resuelve refs string y dict."""
+    layout = _make_layout()
+
+    assert layout.element_to_container == {
+        'inner': 'outer',
+        'a': 'outer',
+        'b': 'inner',
+    }
+
+
+def test_container_ids_built_on_init():
+    """container_ids contiene solo elementos con 'contains'."""
+    layout = _make_layout()
+
+    assert layout.container_ids == {'outer', 'inner'}
+
+
+def test_container_children_normalizes_refs():
+    """container_children guarda IDs string aunque la ref sea dict."""
+    layout = _make_layout()
+
+    assert layout.container_children == {
+        'outer': ['inner', 'a'],
+        'inner': ['b'],
+    }
+
+
+def test_element_to_container_rebuild_after_contains_change():
+    """rebuild_containment_index refleja cambios en 'contains'."""
+    layout = _make_layout()
+    layout.elements_by_id['inner']['contains'].append('free')
+
+    assert 'free' not in layout.element_to_container
+    layout.rebuild_containment_index()
+    assert layout.element_to_container['free'] == 'inner'
+
+
+def test_copy_rebuilds_indexes():
+    """Las copias tienen índices propios sobre sus elementos copiados."""
+    layout = _make_layout()
+    candidate = layout.copy()
+
+    assert candidate.element_to_container == layout.element_to_container
+    assert candidate.element_to_container is not layout.element_to_container
+    assert candidate.elements_by_id['a'] is not layout.elements_by_id['a']
+
+
+def test_normal_elements_track_container_calculated():
+    """normal_elements incluye un contenedor en cuanto se marca calculado."""
+    layout = _make_layout()
+    assert [e['id'] for e in layout.normal_elements] == ['a', 'b', 'free']
+
+    layout.elements_by_id['inner']['_is_container_calculated'] = True
+    assert [e['id'] for e in layout.normal_elements] == ['inner', 'a', 'b', 'free']